@@ -1,6 +1,28 @@
+import os
+
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        check_cache_backend()
+        import api.signals  # noqa: F401
+
+
+def check_cache_backend() -> None:
+    """
+    Запрещает несколько процессов gunicorn с кэшем, не общим для них
+    или без атомарного incr: версии, блокировки и ленты разошлись бы.
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    workers = int(os.getenv('WEB_CONCURRENCY', 1))
+    if workers > 1 and backend in settings.PROCESS_LOCAL_CACHE_BACKENDS:
+        raise ImproperlyConfigured(
+            f'{backend} нельзя использовать с WEB_CONCURRENCY={workers}: '
+            f'укажите общий кэш в CACHE_BACKEND и CACHE_LOCATION'
+        )
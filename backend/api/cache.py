@@ -0,0 +1,64 @@
+import time
+from typing import Dict, Iterable
+
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'version:{name}'
+REFERENCE_VERSION = 'reference'
+RECIPE_LIST_VERSION = 'recipe_list'
+RECIPE_VERSION = 'recipe:{pk}'
+AUTHOR_VERSION = 'author:{pk}'
+USER_STATE_VERSION = 'user_state:{pk}'
+
+
+def get_version(name: str) -> int:
+    """
+    Возвращает текущую версию набора данных.
+
+    Версия хранится в кэше по умолчанию. Все процессы видят ее
+    изменения, только если кэш общий для них (memcached): у LocMemCache
+    версии свои в каждом процессе. Пропавшая из кэша версия создается
+    заново от текущего времени, чтобы не совпасть ни с одной из уже
+    выданных.
+    """
+    key = VERSION_KEY.format(name=name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name: str) -> int:
+    """
+    Увеличивает версию набора данных, делая устаревшими его копии.
+    """
+    key = VERSION_KEY.format(name=name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        get_version(name)
+        return cache.incr(key)
+
+
+def get_versions(names: Iterable[str]) -> Dict[str, int]:
+    """Текущие версии нескольких наборов данных одним запросом к кэшу."""
+    names = list(names)
+    found = cache.get_many([VERSION_KEY.format(name=name) for name in names])
+    return {
+        name: found.get(VERSION_KEY.format(name=name)) or get_version(name)
+        for name in names
+    }
+
+
+def schedule_bump(*names: str) -> None:
+    """
+    Увеличивает версии после фиксации транзакции, чтобы в кэш
+    под новой версией не попали незафиксированные данные.
+    """
+    def bump():
+        for name in names:
+            bump_version(name)
+
+    transaction.on_commit(bump)
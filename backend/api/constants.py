@@ -8,3 +8,5 @@ TAG_NAME_LENGHT = 20
 ING_NAME_LENGHT = 60
 RECIPE_NAME_LENGHT = 50
 MEAS_NAME_LENGHT = 20
+SEARCH_TERM_LENGHT = 64
+BASE64_CHUNK_SIZE = 64 * 1024
@@ -0,0 +1,243 @@
+import time
+import uuid
+from contextlib import contextmanager
+from heapq import merge
+from itertools import islice
+from typing import Dict, Iterator, List, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from recipes.models import Recipe, Subscription
+
+TIMELINE_KEY = 'feed:timeline:{user_id}'
+AUTHOR_FEED_KEY = 'feed:author:{author_id}'
+FANOUT_MODE_KEY = 'feed:mode:{author_id}'
+FEED_LOCK_KEY = 'feed:lock'
+
+Entry = Tuple[float, int]
+
+
+def _entry(pub_date, recipe_id) -> Entry:
+    return (pub_date.timestamp(), recipe_id)
+
+
+def _push(entries: List[Entry], entry: Entry) -> List[Entry]:
+    return [entry] + entries[:settings.FEED_LENGTH - 1]
+
+
+def is_large_author(subscribers_count: int) -> bool:
+    return subscribers_count > settings.FEED_FANOUT_LIMIT
+
+
+def build_timeline(user) -> Dict:
+    """
+    Собирает ленту пользователя из базы данных.
+
+    В ленту попадают рецепты обычных авторов. Крупные авторы
+    запоминаются отдельно: их рецепты подмешиваются при чтении.
+    """
+    authors = Subscription.objects.filter(user=user).values_list(
+        'author_id', 'author__subscribers_count'
+    )
+    large_authors = [
+        author_id for author_id, subscribers_count in authors
+        if is_large_author(subscribers_count)
+    ]
+    recipes = Recipe.objects.filter(
+        author__subscribers__user=user
+    ).exclude(
+        author_id__in=large_authors
+    ).order_by('-pub_date', '-pk').values_list(
+        'pub_date', 'pk'
+    )[:settings.FEED_LENGTH]
+    return {
+        'entries': [_entry(*recipe) for recipe in recipes],
+        'large_authors': large_authors,
+    }
+
+
+def build_author_feed(author_id: int) -> List[Entry]:
+    recipes = Recipe.objects.filter(author_id=author_id).order_by(
+        '-pub_date', '-pk'
+    ).values_list('pub_date', 'pk')[:settings.FEED_LENGTH]
+    return [_entry(*recipe) for recipe in recipes]
+
+
+def subscriptions_recipes(user):
+    return Recipe.objects.filter(
+        author__subscribers__user=user
+    ).order_by('-pub_date', '-pk').values_list('pk', flat=True)
+
+
+class Feed:
+    """
+    Идентификаторы рецептов ленты подписок для пагинатора.
+
+    В кэше хранятся только FEED_LENGTH последних рецептов; страницы
+    дальше них и общее число рецептов длинной ленты читаются из базы
+    данных в том же порядке.
+    """
+
+    def __init__(self, user, recipe_ids: List[int]) -> None:
+        self.user = user
+        self.recipe_ids = recipe_ids
+
+    @property
+    def truncated(self) -> bool:
+        return len(self.recipe_ids) >= settings.FEED_LENGTH
+
+    def count(self) -> int:
+        if not self.truncated:
+            return len(self.recipe_ids)
+        return max(
+            subscriptions_recipes(self.user).count(), len(self.recipe_ids)
+        )
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start = key.start or 0
+        recipe_ids = self.recipe_ids[start:key.stop]
+        if self.truncated and (
+            key.stop is None or key.stop > len(self.recipe_ids)
+        ):
+            recipe_ids += list(subscriptions_recipes(self.user)[
+                max(start, len(self.recipe_ids)):key.stop
+            ])
+        return recipe_ids
+
+    def __iter__(self):
+        return iter(self[0:None])
+
+
+def get_feed(user) -> Feed:
+    """
+    Лента подписок, от новых рецептов к старым.
+
+    Лента обычных авторов читается из кэша одним запросом,
+    рецепты крупных авторов - из их собственных лент (fan-out-on-read).
+    """
+    key = TIMELINE_KEY.format(user_id=user.pk)
+    timeline = cache.get(key)
+    if timeline is None:
+        timeline = build_timeline(user)
+        cache.set(key, timeline, settings.FEED_TIMEOUT)
+    feeds = [timeline['entries']]
+    if timeline['large_authors']:
+        keys = {
+            AUTHOR_FEED_KEY.format(author_id=author_id): author_id
+            for author_id in timeline['large_authors']
+        }
+        cached = cache.get_many(keys)
+        for author_key, author_id in keys.items():
+            if author_key not in cached:
+                cached[author_key] = build_author_feed(author_id)
+                cache.set(
+                    author_key, cached[author_key], settings.FEED_TIMEOUT
+                )
+            feeds.append(cached[author_key])
+    entries = merge(*feeds, reverse=True)
+    return Feed(user, [
+        recipe_id
+        for _, recipe_id in islice(entries, settings.FEED_LENGTH)
+    ])
+
+
+@contextmanager
+def feed_lock() -> Iterator[bool]:
+    """
+    Общая для всех процессов блокировка изменения лент в кэше.
+
+    Без нее два процесса, одновременно прочитавшие одну ленту,
+    затерли бы изменения друг друга. Возвращает False, если
+    блокировку не удалось получить за FEED_LOCK_WAIT секунд.
+    """
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + settings.FEED_LOCK_WAIT
+    while not cache.add(FEED_LOCK_KEY, token, settings.FEED_LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            yield False
+            return
+        time.sleep(0.01)
+    try:
+        yield True
+    finally:
+        if cache.get(FEED_LOCK_KEY) == token:
+            cache.delete(FEED_LOCK_KEY)
+
+
+def fan_out_recipe(recipe_id: int) -> None:
+    """
+    Добавляет новый рецепт в ленты подписчиков автора.
+
+    Обновляются только уже собранные ленты: отсутствующие будут
+    собраны из базы при первом чтении. Рецепты крупных авторов
+    попадают только в ленту самого автора.
+
+    Если автор перешел порог FEED_FANOUT_LIMIT с момента прошлого
+    рецепта, ленты его подписчиков собраны по старому правилу
+    и сбрасываются. Если не удалось получить блокировку,
+    изменяемые ленты тоже сбрасываются.
+    """
+    recipe = Recipe.objects.filter(pk=recipe_id).values_list(
+        'pub_date', 'author_id', 'author__subscribers_count'
+    ).first()
+    if recipe is None:
+        return
+    pub_date, author_id, subscribers_count = recipe
+    entry = _entry(pub_date, recipe_id)
+    large = is_large_author(subscribers_count)
+    if large:
+        keys = [AUTHOR_FEED_KEY.format(author_id=author_id)]
+    else:
+        keys = [
+            TIMELINE_KEY.format(user_id=user_id)
+            for user_id in Subscription.objects.filter(
+                author_id=author_id
+            ).values_list('user_id', flat=True)
+        ]
+    mode_key = FANOUT_MODE_KEY.format(author_id=author_id)
+    with feed_lock() as locked:
+        if cache.get(mode_key) != large:
+            _invalidate_author_feeds([author_id])
+            cache.set(mode_key, large, None)
+        elif not locked:
+            cache.delete_many(keys)
+        else:
+            feeds = cache.get_many(keys)
+            for key, feed in feeds.items():
+                if large:
+                    feeds[key] = _push(feed, entry)
+                else:
+                    feed['entries'] = _push(feed['entries'], entry)
+            cache.set_many(feeds, settings.FEED_TIMEOUT)
+
+
+def invalidate_timeline(user_id: int) -> None:
+    cache.delete(TIMELINE_KEY.format(user_id=user_id))
+
+
+def _invalidate_author_feeds(author_ids: List[int]) -> None:
+    follower_ids = Subscription.objects.filter(
+        author_id__in=author_ids
+    ).values_list('user_id', flat=True).distinct()
+    cache.delete_many(
+        [AUTHOR_FEED_KEY.format(author_id=pk) for pk in author_ids]
+        + [TIMELINE_KEY.format(user_id=pk) for pk in follower_ids]
+    )
+
+
+def invalidate_author_feeds(author_ids) -> None:
+    """
+    Сбрасывает ленты авторов и их подписчиков.
+
+    Используется после массовой загрузки и после удаления рецептов,
+    когда раздавать изменения по лентам дороже, чем собрать ленты
+    заново.
+    """
+    with feed_lock():
+        _invalidate_author_feeds(list(author_ids))
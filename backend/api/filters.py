@@ -1,40 +1,215 @@
+from operator import itemgetter
+from typing import Iterator, List
+
+from django.conf import settings
 from django_filters.rest_framework import FilterSet, filters
 
-from recipes.models import Ingredient, Recipe, Tag
+from api.indexes import mask_ids, popcount, recipe_tag_index, to_mask
+from api.search import search_recipes
+from api.state import get_user_state
+from recipes.models import Favorite, Ingredient, Recipe, ShopingList, Tag
 
 
 class UserFilterMixin:
     """
-    Миксин для фильтрации по пользователю.
+    Миксин для фильтрации по рецептам пользователя в избранном
+    или списке покупок.
     """
 
-    def filter_by_user(self, queryset, user_field, value):
+    def filter_by_user(self, queryset, recipe_field, model, value):
         if self.request.user.is_authenticated and value:
-            return queryset.filter(**{user_field: self.request.user})
+            recipe_ids = get_user_state(self.request).recipe_ids(model)
+            return queryset.filter(
+                **{f'{recipe_field}__in': recipe_ids}
+            ).distinct()
         return queryset
 
 
-class RecipeFilter(UserFilterMixin, FilterSet):
+class MaskedQuerySet:
+    """
+    Выборка рецептов, дополнительно отфильтрованная битовой маской.
+
+    Id маски разбиваются на пакеты по BITMAP_SCAN_CHUNK, и каждый пакет
+    пересекается с выборкой в базе данных условием pk__in. Для среза
+    из каждого пакета берутся первые строки в порядке выборки,
+    результаты сливаются, и загружаются только объекты среза.
+    Поддерживает то, что нужно пагинаторам и get_object:
+    count, срезы, order_by, filter и get.
+    """
+
+    def __init__(self, queryset, mask: int) -> None:
+        self.queryset = queryset
+        self.mask = mask
+        self.model = queryset.model
+
+    @property
+    def ordered(self) -> bool:
+        return self.queryset.ordered
+
+    def order_by(self, *fields) -> 'MaskedQuerySet':
+        return MaskedQuerySet(self.queryset.order_by(*fields), self.mask)
+
+    def filter(self, *args, **kwargs) -> 'MaskedQuerySet':
+        return MaskedQuerySet(
+            self.queryset.filter(*args, **kwargs), self.mask
+        )
+
+    def get(self, *args, **kwargs):
+        obj = self.queryset.get(*args, **kwargs)
+        if not self.mask >> obj.pk & 1:
+            raise self.model.DoesNotExist
+        return obj
+
+    def chunks(self) -> Iterator[List[int]]:
+        ids = mask_ids(self.mask)
+        size = settings.BITMAP_SCAN_CHUNK
+        for start in range(0, len(ids), size):
+            yield ids[start:start + size]
+
+    def count(self) -> int:
+        if not self.queryset.query.where:
+            return popcount(self.mask)
+        queryset = self.queryset.order_by().prefetch_related(None)
+        return sum(
+            queryset.filter(pk__in=chunk).count() for chunk in self.chunks()
+        )
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def get_ordering(self) -> List[str]:
+        ordering = list(
+            self.queryset.query.order_by or self.model._meta.ordering
+        )
+        if not {'pk', '-pk', 'id', '-id'} & set(ordering):
+            ordering.append('-pk')
+        return ordering
+
+    def matching_ids(self, stop=None) -> List[int]:
+        """Id подходящих рецептов в порядке выборки, не больше stop."""
+        ordering = self.get_ordering()
+        fields = [field.lstrip('-') for field in ordering]
+        queryset = self.queryset.prefetch_related(None).values_list(
+            *fields, 'pk'
+        )
+        rows = []
+        for chunk in self.chunks():
+            rows.extend(queryset.filter(pk__in=chunk)[:stop])
+        for index in reversed(range(len(ordering))):
+            rows.sort(
+                key=itemgetter(index),
+                reverse=ordering[index].startswith('-')
+            )
+        return [row[-1] for row in rows[:stop]]
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        ids = self.matching_ids(key.stop)[key.start or 0:]
+        objects = self.queryset.in_bulk(ids)
+        return [objects[pk] for pk in ids if pk in objects]
+
+    def __iter__(self):
+        return iter(self[0:None])
+
+
+class RecipeFilter(FilterSet):
+    """
+    Фильтр рецептов.
+
+    Фильтры по тегам, избранному и списку покупок отвечают битовыми
+    масками без соединения таблиц. Маски пересекаются; небольшой
+    результат применяется к запросу условием по id, большой -
+    через MaskedQuerySet.
+    """
+    bitmap_filters = ('tags', 'is_favorited', 'is_in_shopping_cart')
+
     author = filters.CharFilter(field_name='author__id')
     tags = filters.ModelMultipleChoiceFilter(
         field_name='tags__slug',
         queryset=Tag.objects.all(),
-        to_field_name='slug'
+        to_field_name='slug',
+        method='filter_tags'
     )
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
         fields = ('name',)
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.masks = {}
+
+    def filter_queryset(self, queryset):
+        self.masks = {}
+        self.base_queryset = super().filter_queryset(queryset)
+        mask = self.get_mask()
+        if mask is None:
+            return self.base_queryset
+        if popcount(mask) <= settings.BITMAP_IN_LIMIT:
+            return self.base_queryset.filter(pk__in=mask_ids(mask))
+        return MaskedQuerySet(self.base_queryset, mask)
+
+    def get_mask(self, exclude=()):
+        mask = None
+        for name, value in self.masks.items():
+            if name not in exclude:
+                mask = value if mask is None else mask & value
+        return mask
+
+    def filter_search(self, queryset, name, value):
+        """
+        Полнотекстовый поиск по названию, описанию и ингредиентам.
+        """
+        return search_recipes(queryset, value)
+
+    def filter_tags(self, queryset, name, value):
+        if value:
+            self.masks['tags'] = recipe_tag_index.recipes_mask(
+                tag.slug for tag in value
+            )
+        return queryset
+
     def filter_is_favorited(self, queryset, name, value):
-        return self.filter_by_user(queryset, 'recipe__user', value)
+        return self.filter_by_user(queryset, name, Favorite, value)
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
-        return self.filter_by_user(queryset, 'shoping_list__user', value)
+        return self.filter_by_user(queryset, name, ShopingList, value)
+
+    def filter_by_user(self, queryset, name, model, value):
+        if self.request.user.is_authenticated and value:
+            self.masks[name] = get_user_state(self.request).recipe_mask(model)
+        return queryset
+
+    def tag_facets(self):
+        """
+        Число рецептов по каждому тегу с учетом остальных фильтров.
+
+        Фильтр по тегам при подсчете не учитывается, чтобы было видно,
+        сколько рецептов добавит выбор еще одного тега.
+        """
+        if not self.is_valid():
+            return {}
+        self.filter_queryset(self.queryset.all())
+        mask = self.get_mask(exclude=('tags',))
+        if any(
+            value not in (None, '')
+            for name, value in self.form.cleaned_data.items()
+            if name not in self.bitmap_filters
+        ):
+            ids_mask = to_mask(
+                self.base_queryset.values_list('pk', flat=True)
+            )
+            mask = ids_mask if mask is None else mask & ids_mask
+        return {
+            slug: popcount(tag_mask if mask is None else tag_mask & mask)
+            for slug, tag_mask in recipe_tag_index.get_masks().items()
+        }
 
 
 class IngredientFilter(FilterSet):
@@ -56,7 +231,7 @@ class TagFilter(UserFilterMixin, FilterSet):
         fields = ('name',)
 
     def filter_is_favorited(self, queryset, name, value):
-        return self.filter_by_user(queryset, 'users_recipe__user', value)
+        return self.filter_by_user(queryset, 'recipe', Favorite, value)
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
-        return self.filter_by_user(queryset, 'shopping_cart__user', value)
+        return self.filter_by_user(queryset, 'recipe', ShopingList, value)
@@ -0,0 +1,153 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image
+
+from api.cache import (AUTHOR_VERSION, RECIPE_LIST_VERSION, RECIPE_VERSION,
+                       bump_version)
+from recipes.models import Recipe
+from users.models import User
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+FORMAT_EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp'}
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_WORKERS,
+            thread_name_prefix='image-variants'
+        )
+    return _executor
+
+
+def variant_name(name: str, variant: str) -> str:
+    """
+    Путь к производному изображению: variants/<имя>_<вариант>.<формат>.
+    """
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    extension = FORMAT_EXTENSIONS[settings.IMAGE_VARIANTS[variant]['format']]
+    return os.path.join(
+        directory, 'variants', f'{stem}_{variant}.{extension}'
+    )
+
+
+def generate_variants(name: str) -> None:
+    """
+    Создает миниатюры и WebP-версии изображения, которых еще нет,
+    и отмечает изображение как готовое.
+    """
+    missing = {
+        variant: options
+        for variant, options in settings.IMAGE_VARIANTS.items()
+        if not default_storage.exists(variant_name(name, variant))
+    }
+    if missing:
+        save_variants(name, missing)
+    mark_variants_ready(name)
+
+
+def save_variants(name: str, variants: Dict[str, dict]) -> None:
+    with default_storage.open(name) as file, Image.open(file) as original:
+        original.load()
+        for variant, options in variants.items():
+            image = original.copy()
+            if options['size']:
+                image.thumbnail(options['size'])
+            if image.mode not in ('RGB', 'RGBA') or (
+                options['format'] == 'JPEG' and image.mode == 'RGBA'
+            ):
+                image = image.convert('RGB')
+            buffer = BytesIO()
+            image.save(
+                buffer, options['format'], quality=settings.IMAGE_QUALITY
+            )
+            default_storage.save(
+                variant_name(name, variant), ContentFile(buffer.getvalue())
+            )
+
+
+def mark_variants_ready(name: str) -> None:
+    """
+    Запоминает, что варианты изображения созданы.
+
+    Рецепты и авторы с этим изображением получают новые версии,
+    чтобы закэшированные ответы с адресами оригинала обновились.
+    """
+    recipe_ids = list(Recipe.objects.filter(image=name).exclude(
+        image_variants_for=name
+    ).values_list('pk', flat=True))
+    if recipe_ids:
+        Recipe.objects.filter(pk__in=recipe_ids).update(
+            image_variants_for=name
+        )
+    author_ids = list(User.objects.filter(avatar=name).exclude(
+        avatar_variants_for=name
+    ).values_list('pk', flat=True))
+    if author_ids:
+        User.objects.filter(pk__in=author_ids).update(
+            avatar_variants_for=name
+        )
+    if not recipe_ids and not author_ids:
+        return
+    bump_version(RECIPE_LIST_VERSION)
+    for recipe_id in recipe_ids:
+        bump_version(RECIPE_VERSION.format(pk=recipe_id))
+    for author_id in author_ids:
+        bump_version(AUTHOR_VERSION.format(pk=author_id))
+
+
+def _generate_variants_safely(name: str) -> None:
+    try:
+        generate_variants(name)
+    except Exception:
+        logger.exception('Не удалось создать варианты изображения %s', name)
+    finally:
+        connection.close()
+
+
+def schedule_variants(field_file) -> None:
+    """
+    Ставит создание вариантов изображения в очередь пула потоков.
+
+    Задача запускается после фиксации транзакции и не задерживает
+    обработку запроса.
+    """
+    if not field_file:
+        return
+    name = field_file.name
+    transaction.on_commit(
+        lambda: get_executor().submit(_generate_variants_safely, name)
+    )
+
+
+def variant_urls(field_file) -> Dict[str, str]:
+    """
+    Адреса вариантов изображения.
+
+    Готовность вариантов берется из поля <поле>_variants_for объекта,
+    без обращений к хранилищу. Пока варианты не созданы, вместо них
+    отдается адрес оригинала.
+    """
+    ready = getattr(
+        field_file.instance, f'{field_file.field.name}_variants_for', ''
+    ) == field_file.name
+    return {
+        variant: (
+            default_storage.url(variant_name(field_file.name, variant))
+            if ready else field_file.url
+        )
+        for variant in settings.IMAGE_VARIANTS
+    }
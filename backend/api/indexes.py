@@ -0,0 +1,284 @@
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from django.db import transaction
+
+from api.cache import bump_version, get_version, schedule_bump
+from recipes.models import AmountIngredient, Ingredient, Recipe, Tag
+
+
+def to_mask(ids: Iterable[int]) -> int:
+    """Битовая маска, в которой установлены биты с номерами ids."""
+    mask = 0
+    for pk in ids:
+        mask |= 1 << pk
+    return mask
+
+
+def popcount(mask: int) -> int:
+    return bin(mask).count('1')
+
+
+def mask_ids(mask: int) -> List[int]:
+    """Номера установленных битов маски по возрастанию."""
+    bits = bin(mask)[:1:-1]
+    ids = []
+    pk = bits.find('1')
+    while pk != -1:
+        ids.append(pk)
+        pk = bits.find('1', pk + 1)
+    return ids
+
+
+class ProcessLocalIndex:
+    """
+    Базовый класс индекса, который хранится в памяти процесса.
+
+    Индекс перестраивается при первом обращении после того,
+    как изменилась версия данных в общем кэше.
+    """
+    version_name: str = ''
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+
+    def build(self) -> None:
+        raise NotImplementedError
+
+    def ensure_fresh(self) -> None:
+        version = get_version(self.version_name)
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                self.build()
+                self._version = version
+
+    def invalidate(self) -> None:
+        bump_version(self.version_name)
+
+    def schedule_invalidate(self) -> None:
+        """
+        Сбрасывает индекс после фиксации транзакции, чтобы другой процесс
+        не перестроил его по еще не зафиксированным данным.
+        """
+        schedule_bump(self.version_name)
+
+    def apply_change(self, change: Callable[[], None]) -> None:
+        """
+        Применяет изменение к индексу процесса и повышает общую версию.
+
+        Изменение применяется на месте, только если индекс процесса
+        был актуален; иначе он будет перестроен при следующем обращении.
+        Опирается на атомарный incr кэша: с FileBasedCache два процесса
+        могут получить одну и ту же версию, и изменение одного из них
+        не попадет в индекс другого.
+        """
+        with self._lock:
+            version = bump_version(self.version_name)
+            if self._version is not None and self._version == version - 1:
+                change()
+                self._version = version
+
+
+class IngredientSearchIndex(ProcessLocalIndex):
+    """
+    Индекс для автодополнения ингредиентов.
+
+    Хранит отсортированные названия в нижнем регистре: совпадения
+    по префиксу ищутся бинарным поиском, затем при нехватке результатов
+    добавляются совпадения по подстроке.
+    """
+    version_name = 'ingredients'
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._data: Tuple[List[str], List[Dict[str, Any]]] = ([], [])
+
+    def build(self) -> None:
+        items = sorted(
+            Ingredient.objects.values('id', 'name', 'measurement_unit'),
+            key=lambda item: item['name'].casefold()
+        )
+        self._data = ([item['name'].casefold() for item in items], items)
+
+    def search(
+            self, query: str, limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Ищет ингредиенты по названию.
+
+        Сначала идут совпадения по префиксу, затем по подстроке.
+        Пустой запрос возвращает все ингредиенты.
+        """
+        self.ensure_fresh()
+        keys, items = self._data
+        query = query.strip().casefold()
+        if not query:
+            return items[:limit]
+        results = []
+        position = bisect_left(keys, query)
+        while (
+            position < len(keys)
+            and keys[position].startswith(query)
+            and (limit is None or len(results) < limit)
+        ):
+            results.append(items[position])
+            position += 1
+        if limit is not None and len(results) >= limit:
+            return results
+        matches = []
+        for index, key in enumerate(keys):
+            found = key.find(query)
+            if found > 0:
+                matches.append((found, index))
+        matches.sort()
+        results.extend(items[index] for _, index in matches)
+        return results[:limit]
+
+
+class RecipeIngredientIndex(ProcessLocalIndex):
+    """
+    Битовый индекс состава рецептов.
+
+    Для каждого рецепта хранится маска, в которой номер бита равен
+    идентификатору ингредиента. Подбор рецептов по продуктам
+    сводится к побитовым операциям над масками.
+    """
+    version_name = 'recipe_ingredients'
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._masks: Dict[int, Tuple[int, int]] = {}
+
+    def build(self) -> None:
+        masks = defaultdict(int)
+        for recipe_id, ingredient_id in AmountIngredient.objects.values_list(
+            'recipe_id', 'ingredient_id'
+        ).iterator():
+            masks[recipe_id] |= 1 << ingredient_id
+        self._masks = {
+            recipe_id: (mask, popcount(mask))
+            for recipe_id, mask in masks.items()
+        }
+
+    def _set(self, recipe_id: int, mask: Optional[int]) -> None:
+        masks = dict(self._masks)
+        if mask:
+            masks[recipe_id] = (mask, popcount(mask))
+        else:
+            masks.pop(recipe_id, None)
+        self._masks = masks
+
+    def update(self, recipe_id: int, ingredient_ids: Iterable[int]) -> None:
+        mask = to_mask(ingredient_ids)
+        self.apply_change(lambda: self._set(recipe_id, mask))
+
+    def remove(self, recipe_id: int) -> None:
+        self.apply_change(lambda: self._set(recipe_id, None))
+
+    def schedule_update(
+            self, recipe_id: int, ingredient_ids: Iterable[int]
+    ) -> None:
+        """
+        Обновляет маску рецепта после фиксации текущей транзакции.
+        """
+        ingredient_ids = list(ingredient_ids)
+        transaction.on_commit(lambda: self.update(recipe_id, ingredient_ids))
+
+    def match(
+            self,
+            available: Iterable[int],
+            max_missing: int = 0,
+            include: Iterable[int] = (),
+            exclude: Iterable[int] = ()
+    ) -> List[Tuple[int, int, float]]:
+        """
+        Рецепты, которым не хватает не более max_missing ингредиентов.
+
+        Возвращает кортежи (рецепт, число недостающих, покрытие),
+        отсортированные по убыванию доли имеющихся ингредиентов.
+        Рецепты без единого имеющегося ингредиента не возвращаются.
+        """
+        self.ensure_fresh()
+        masks = self._masks
+        bits = max(
+            (mask.bit_length() for mask, _ in masks.values()), default=0
+        )
+        include = set(include)
+        if any(pk >= bits for pk in include):
+            return []
+        available_mask = to_mask(pk for pk in available if pk < bits)
+        include_mask = to_mask(include)
+        exclude_mask = to_mask(pk for pk in exclude if pk < bits)
+        results = []
+        for recipe_id, (mask, total) in masks.items():
+            if mask & include_mask != include_mask or mask & exclude_mask:
+                continue
+            missing = popcount(mask & ~available_mask)
+            if missing <= max_missing and missing < total:
+                results.append(
+                    (recipe_id, missing, (total - missing) / total)
+                )
+        results.sort(key=lambda result: (-result[2], result[1], -result[0]))
+        return results
+
+
+class RecipeTagIndex(ProcessLocalIndex):
+    """
+    Битовый индекс рецептов по тегам.
+
+    Для каждого тега хранится маска, в которой номер бита равен
+    идентификатору рецепта с этим тегом.
+    """
+    version_name = 'recipe_tags'
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._masks: Dict[str, int] = {}
+
+    def build(self) -> None:
+        masks = defaultdict(int)
+        for slug in Tag.objects.values_list('slug', flat=True):
+            masks[slug] = 0
+        for slug, recipe_id in Recipe.tags.through.objects.values_list(
+            'tag__slug', 'recipe_id'
+        ).iterator():
+            masks[slug] |= 1 << recipe_id
+        self._masks = dict(masks)
+
+    def _set(self, recipe_id: int, slugs: Iterable[str]) -> None:
+        bit = 1 << recipe_id
+        masks = {slug: mask & ~bit for slug, mask in self._masks.items()}
+        for slug in slugs:
+            masks[slug] = masks.get(slug, 0) | bit
+        self._masks = masks
+
+    def update(self, recipe_id: int) -> None:
+        slugs = list(Tag.objects.filter(
+            recipe=recipe_id
+        ).values_list('slug', flat=True))
+        self.apply_change(lambda: self._set(recipe_id, slugs))
+
+    def remove(self, recipe_id: int) -> None:
+        self.apply_change(lambda: self._set(recipe_id, ()))
+
+    def get_masks(self) -> Dict[str, int]:
+        self.ensure_fresh()
+        return self._masks
+
+    def recipes_mask(self, slugs: Iterable[str]) -> int:
+        """Маска рецептов, у которых есть хотя бы один из тегов."""
+        masks = self.get_masks()
+        mask = 0
+        for slug in slugs:
+            mask |= masks.get(slug, 0)
+        return mask
+
+
+ingredient_index = IngredientSearchIndex()
+recipe_ingredient_index = RecipeIngredientIndex()
+recipe_tag_index = RecipeTagIndex()
@@ -0,0 +1,199 @@
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.parse import quote
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+
+def percentile(values, fraction):
+    """Процентиль по ближайшему рангу для отсортированного списка."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class Command(BaseCommand):
+    """
+    Нагрузочный прогон основных адресов API.
+
+    По умолчанию запросы выполняются тестовым клиентом Django в этом же
+    процессе, что позволяет считать SQL-запросы. С --url запросы идут
+    к запущенному серверу, и их можно выполнять параллельно.
+    Для прогона нужны данные, например из команды generate_data.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--user', default='bench_user_0',
+            help='Пользователь для запросов с авторизацией'
+        )
+        parser.add_argument(
+            '--url', help='Адрес запущенного сервера, например '
+                          'http://127.0.0.1:8000'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=1,
+            help='Число параллельных запросов при работе с --url'
+        )
+        parser.add_argument(
+            '--only', nargs='*', help='Запустить только указанные сценарии'
+        )
+        parser.add_argument(
+            '--json', action='store_true',
+            help='Вывести результаты в JSON для сравнения сборок'
+        )
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['user']).first()
+        if user is None:
+            raise CommandError(f'Пользователь {options["user"]} не найден')
+        if not Recipe.objects.exists():
+            raise CommandError('Нет рецептов: запустите generate_data')
+        self.token = Token.objects.get_or_create(user=user)[0].key
+        self.base_url = options['url']
+        host = settings.ALLOWED_HOSTS[0].strip()
+        self.client = Client(HTTP_HOST='localhost' if host == '*' else host)
+        rng = random.Random(options['seed'])
+        results = []
+        for name, auth, make_url in self.get_scenarios(rng):
+            if options['only'] and name not in options['only']:
+                continue
+            urls = [
+                make_url()
+                for _ in range(options['warmup'] + options['requests'])
+            ]
+            for url in urls[:options['warmup']]:
+                self.request(url, auth)
+            results.append(self.measure(
+                name, auth, urls[options['warmup']:], options['concurrency']
+            ))
+        if options['json']:
+            self.stdout.write(json.dumps(results, ensure_ascii=False))
+            return
+        self.stdout.write(
+            f'{"сценарий":<20}{"p50, мс":>10}{"p95, мс":>10}'
+            f'{"запр./с":>10}{"SQL":>8}{"ошибки":>8}'
+        )
+        for result in results:
+            queries = result['queries']
+            self.stdout.write(
+                f'{result["name"]:<20}{result["p50"]:>10.1f}'
+                f'{result["p95"]:>10.1f}{result["throughput"]:>10.1f}'
+                f'{"-" if queries is None else f"{queries:.1f}":>8}'
+                f'{result["errors"]:>8}'
+            )
+
+    def get_scenarios(self, rng):
+        recipe_ids = list(
+            Recipe.objects.values_list('pk', flat=True)[:1000]
+        )
+        names = list(Recipe.objects.values_list('name', flat=True)[:1000])
+        slugs = list(Tag.objects.values_list('slug', flat=True))
+        ingredients = list(
+            Ingredient.objects.values_list('pk', 'name')[:1000]
+        )
+
+        def ingredient_ids():
+            return ','.join(
+                str(pk) for pk, _ in rng.sample(
+                    ingredients, min(len(ingredients), 10)
+                )
+            )
+
+        return (
+            ('recipes', False,
+             lambda: f'/api/recipes/?page={rng.randint(1, 5)}'),
+            ('recipes-cursor', False, lambda: '/api/recipes/?cursor='),
+            ('recipes-tags', False,
+             lambda: '/api/recipes/?facets=1&' + '&'.join(
+                 f'tags={slug}' for slug in rng.sample(
+                     slugs, min(len(slugs), 2)
+                 )
+             )),
+            ('recipes-favorited', True,
+             lambda: '/api/recipes/?is_favorited=1'),
+            ('recipe', False,
+             lambda: f'/api/recipes/{rng.choice(recipe_ids)}/'),
+            ('recipes-search', False,
+             lambda: '/api/recipes/?search='
+                     + quote(rng.choice(names).split()[0])),
+            ('recipes-match', False,
+             lambda: f'/api/recipes/match/?missing=3&ingredients='
+                     f'{ingredient_ids()}'),
+            ('feed', True, lambda: '/api/recipes/feed/'),
+            ('shopping-cart', True,
+             lambda: '/api/recipes/download_shopping_cart/?format=txt'),
+            ('ingredients', False,
+             lambda: '/api/ingredients/?name='
+                     + quote(rng.choice(ingredients)[1][:3])),
+            ('tags', False, lambda: '/api/tags/'),
+            ('users', False, lambda: '/api/users/?limit=10'),
+            ('subscriptions', True,
+             lambda: '/api/users/subscriptions/?recipes_limit=3'),
+        )
+
+    def request(self, url, auth):
+        """Выполняет запрос и возвращает код ответа."""
+        headers = {'HTTP_AUTHORIZATION': f'Token {self.token}'} if auth else {}
+        if self.base_url is None:
+            response = self.client.get(url, **headers)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            return response.status_code
+        request = Request(self.base_url.rstrip('/') + url)
+        if auth:
+            request.add_header('Authorization', f'Token {self.token}')
+        try:
+            with urlopen(request) as response:
+                response.read()
+                return response.status
+        except HTTPError as e:
+            return e.code
+
+    def timed_request(self, url, auth):
+        started = time.perf_counter()
+        status = self.request(url, auth)
+        return time.perf_counter() - started, status
+
+    def measure(self, name, auth, urls, concurrency):
+        queries = None
+        started = time.perf_counter()
+        if self.base_url is None:
+            timings = []
+            query_count = 0
+            for url in urls:
+                with CaptureQueriesContext(connection) as context:
+                    timings.append(self.timed_request(url, auth))
+                query_count += len(context.captured_queries)
+            queries = query_count / len(urls) if urls else 0
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                timings = list(executor.map(
+                    lambda url: self.timed_request(url, auth), urls
+                ))
+        elapsed = time.perf_counter() - started
+        durations = sorted(duration * 1000 for duration, _ in timings)
+        return {
+            'name': name,
+            'requests': len(urls),
+            'p50': percentile(durations, 0.5),
+            'p95': percentile(durations, 0.95),
+            'throughput': len(urls) / elapsed if elapsed else 0.0,
+            'queries': queries,
+            'errors': sum(status >= 400 for _, status in timings),
+        }
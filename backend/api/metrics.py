@@ -0,0 +1,225 @@
+import glob
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger('api.metrics')
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+REQUESTS = 'foodgram_http_requests_total'
+LATENCY = 'foodgram_http_request_duration_seconds'
+QUERIES = 'foodgram_http_request_queries'
+
+ARCHIVE_FILE = 'archive.json'
+
+
+def view_label(view_func, method: str) -> str:
+    """
+    Имя представления для метрик: класс и действие для ViewSet,
+    класс для APIView, модуль и имя функции для остальных.
+    """
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return f'{view_func.__module__}.{view_func.__name__}'
+    actions = getattr(view_func, 'actions', None)
+    if actions:
+        return f'{cls.__name__}.{actions.get(method.lower(), method.lower())}'
+    return cls.__name__
+
+
+class MetricsRegistry:
+    """
+    Счетчики и гистограммы запросов одного процесса.
+
+    Каждый процесс периодически сохраняет свои значения в файл
+    METRICS_DIR/<pid>.json, а при выдаче метрик файлы всех процессов
+    складываются. Значения завершившегося процесса переносятся
+    в METRICS_DIR/archive.json (mark_process_dead), чтобы счетчики
+    не уменьшались, а число файлов не росло.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.pid = None
+        self.flushed = 0.0
+
+    def reset(self) -> None:
+        """Начинает значения заново или с файла, оставшегося от этого pid."""
+        self.pid = os.getpid()
+        self.requests: Dict[Tuple[str, str, str], int] = {}
+        self.histograms: Dict[str, Dict[str, list]] = {
+            LATENCY: {}, QUERIES: {}
+        }
+        try:
+            with open(self.path) as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return
+        for view, method, status, count in data['requests']:
+            self.requests[(view, method, status)] = count
+        for name, values in data['histograms'].items():
+            self.histograms[name] = values
+
+    @property
+    def path(self) -> str:
+        return os.path.join(settings.METRICS_DIR, f'{self.pid}.json')
+
+    def observe(self, view: str, method: str, status: int,
+                duration: float, queries: int) -> None:
+        with self.lock:
+            if self.pid != os.getpid():
+                self.reset()
+            key = (view, method, f'{status // 100}xx')
+            self.requests[key] = self.requests.get(key, 0) + 1
+            for name, buckets, value in (
+                (LATENCY, LATENCY_BUCKETS, duration),
+                (QUERIES, QUERY_BUCKETS, queries),
+            ):
+                histogram = self.histograms[name].setdefault(
+                    view, [[0] * (len(buckets) + 1), 0, 0]
+                )
+                counts = histogram[0]
+                for index, bound in enumerate(buckets):
+                    if value <= bound:
+                        counts[index] += 1
+                        break
+                else:
+                    counts[-1] += 1
+                histogram[1] += value
+                histogram[2] += 1
+            now = time.monotonic()
+            if now - self.flushed >= settings.METRICS_FLUSH_INTERVAL:
+                self.flushed = now
+                try:
+                    self.flush()
+                except OSError as e:
+                    logger.warning('Не удалось сохранить метрики: %s', e)
+
+    def flush(self) -> None:
+        """Атомарно записывает значения процесса в его файл."""
+        if self.pid is None:
+            return
+        write_data(self.path, {
+            'requests': self.requests, 'histograms': self.histograms
+        })
+
+    def collect(self) -> Dict:
+        """Складывает значения из файлов всех процессов."""
+        with self.lock:
+            if self.pid == os.getpid():
+                self.flush()
+                self.flushed = time.monotonic()
+        return merge_files(
+            glob.glob(os.path.join(settings.METRICS_DIR, '*.json'))
+        )
+
+    def mark_process_dead(self, pid: int) -> None:
+        """
+        Переносит значения завершившегося процесса в архивный файл
+        и удаляет файл процесса. Вызывается мастером gunicorn
+        из хука child_exit.
+        """
+        path = os.path.join(settings.METRICS_DIR, f'{pid}.json')
+        if not os.path.exists(path):
+            return
+        archive = os.path.join(settings.METRICS_DIR, ARCHIVE_FILE)
+        write_data(archive, merge_files([archive, path]))
+        os.remove(path)
+
+    def render(self) -> str:
+        """Метрики в текстовом формате Prometheus."""
+        data = self.collect()
+        lines = [
+            f'# HELP {REQUESTS} Число запросов по представлениям.',
+            f'# TYPE {REQUESTS} counter',
+        ]
+        for (view, method, status), count in sorted(data['requests'].items()):
+            lines.append(
+                f'{REQUESTS}{{view="{view}",method="{method}",'
+                f'status="{status}"}} {count}'
+            )
+        for name, buckets, description in (
+            (LATENCY, LATENCY_BUCKETS, 'Время обработки запроса, с.'),
+            (QUERIES, QUERY_BUCKETS, 'Число SQL-запросов на запрос.'),
+        ):
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} histogram')
+            for view, (counts, total, count) in sorted(
+                data['histograms'][name].items()
+            ):
+                lines.extend(histogram_lines(
+                    name, view, buckets, counts, total, count
+                ))
+        return '\n'.join(lines) + '\n'
+
+
+def merge_files(paths: List[str]) -> Dict:
+    """Складывает значения из файлов метрик; битые файлы пропускаются."""
+    requests = {}
+    histograms = {LATENCY: {}, QUERIES: {}}
+    for path in paths:
+        try:
+            with open(path) as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            continue
+        for view, method, status, count in data['requests']:
+            key = (view, method, status)
+            requests[key] = requests.get(key, 0) + count
+        for name, views in data['histograms'].items():
+            for view, (counts, total, count) in views.items():
+                current = histograms[name].setdefault(
+                    view, [[0] * len(counts), 0, 0]
+                )
+                current[0] = [a + b for a, b in zip(current[0], counts)]
+                current[1] += total
+                current[2] += count
+    return {'requests': requests, 'histograms': histograms}
+
+
+def write_data(path: str, data: Dict) -> None:
+    """Атомарно записывает значения метрик в файл."""
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    descriptor, temp_path = tempfile.mkstemp(
+        dir=settings.METRICS_DIR, suffix='.tmp'
+    )
+    try:
+        with os.fdopen(descriptor, 'w') as file:
+            json.dump({
+                'requests': [
+                    [*key, count] for key, count in data['requests'].items()
+                ],
+                'histograms': data['histograms'],
+            }, file)
+        os.replace(temp_path, path)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def histogram_lines(name: str, view: str, buckets: tuple, counts: List[int],
+                    total: float, count: int) -> List[str]:
+    lines = []
+    cumulative = 0
+    for bound, bucket_count in zip((*buckets, '+Inf'), counts):
+        cumulative += bucket_count
+        lines.append(
+            f'{name}_bucket{{view="{view}",le="{bound}"}} {cumulative}'
+        )
+    lines.append(f'{name}_sum{{view="{view}"}} {total}')
+    lines.append(f'{name}_count{{view="{view}"}} {count}')
+    return lines
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,124 @@
+import json
+import logging
+import time
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection
+
+from api.metrics import registry, view_label
+
+logger = logging.getLogger('api.slow_requests')
+
+current_stats: ContextVar[Optional['RequestStats']] = ContextVar(
+    'current_stats', default=None
+)
+
+
+class RequestStats:
+    """
+    Статистика одного запроса: SQL-запросы и время по этапам.
+
+    Время хранится в секундах.
+    """
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.queries: List[Tuple[float, float, str]] = []
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.view_name: Optional[str] = None
+        self.view_started: Optional[float] = None
+        self.view_time = 0.0
+        self.total_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        """Обертка connection.execute_wrapper, засекающая каждый запрос."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.sql_time += duration
+            self.queries.append((started - self.started, duration, sql))
+
+    def heaviest_queries(self, limit: int) -> List[Tuple[float, str]]:
+        return sorted(
+            ((duration, sql) for _, duration, sql in self.queries),
+            reverse=True
+        )[:limit]
+
+    def server_timing(self) -> str:
+        return ', '.join((
+            f'db;dur={self.sql_time * 1000:.1f};'
+            f'desc="{len(self.queries)} queries"',
+            f'serialize;dur={self.serializer_time * 1000:.1f}',
+            f'view;dur={self.view_time * 1000:.1f}',
+            f'total;dur={self.total_time * 1000:.1f}',
+        ))
+
+
+class InstrumentationMiddleware:
+    """
+    Считает SQL-запросы и время обработки каждого запроса.
+
+    Для персонала или при SERVER_TIMING=True добавляет заголовок
+    Server-Timing; медленные запросы пишет в лог api.slow_requests.
+    При METRICS_ENABLED=True передает время и число запросов в метрики.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats()
+        request.stats = stats
+        token = current_stats.set(stats)
+        try:
+            with connection.execute_wrapper(stats):
+                response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        stats.total_time = time.perf_counter() - stats.started
+        if stats.view_started is not None:
+            stats.view_time = time.perf_counter() - stats.view_started
+        user = getattr(request, 'user', None)
+        if settings.SERVER_TIMING or getattr(user, 'is_staff', False):
+            response['Server-Timing'] = stats.server_timing()
+        if (
+            stats.total_time * 1000 >= settings.SLOW_REQUEST_MS
+            or len(stats.queries) >= settings.SLOW_REQUEST_QUERIES
+        ):
+            self.log_slow_request(request, response, stats)
+        if settings.METRICS_ENABLED:
+            registry.observe(
+                stats.view_name or 'unresolved', request.method,
+                response.status_code, stats.total_time, len(stats.queries)
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.stats.view_name = view_label(view_func, request.method)
+        request.stats.view_started = time.perf_counter()
+
+    def log_slow_request(self, request, response, stats):
+        match = request.resolver_match
+        logger.warning(json.dumps({
+            'method': request.method,
+            'path': request.get_full_path(),
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'total_ms': round(stats.total_time * 1000, 1),
+            'view_ms': round(stats.view_time * 1000, 1),
+            'sql_ms': round(stats.sql_time * 1000, 1),
+            'serializer_ms': round(stats.serializer_time * 1000, 1),
+            'queries': len(stats.queries),
+            'heaviest_queries': [
+                {'ms': round(duration * 1000, 1), 'sql': sql[:1000]}
+                for duration, sql in stats.heaviest_queries(
+                    settings.SLOW_REQUEST_TOP_QUERIES
+                )
+            ],
+        }, ensure_ascii=False))
@@ -1,6 +1,16 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control, patch_vary_headers
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import mixins, permissions, viewsets
+from rest_framework import mixins, permissions, status, viewsets
+from rest_framework.response import Response
 
+from api.cache import REFERENCE_VERSION, get_version, get_versions
+from api.middleware import current_stats
+from api.state import get_user_state
 from recipes.models import AmountIngredient
 
 
@@ -11,10 +21,194 @@ class IngridientTagMixin(
 ):
     """
     Миксин для работы с тегами и ингредиентами.
+
+    Ответы кэшируются по версии справочников и параметрам запроса
+    и снабжаются заголовком ETag для условных запросов.
     """
     pagination_class = None
     filter_backends = [DjangoFilterBackend]
     permission_classes = (permissions.AllowAny,)
+    cache_bypass_params = ('is_favorited', 'is_in_shopping_cart')
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(super().retrieve, *args, **kwargs)
+
+    def get_cache_key(self) -> str:
+        """
+        Ключ кэша из версии справочников, пути, формата и параметров.
+
+        Путь и параметры хэшируются: ключи memcached ограничены
+        250 символами без пробелов.
+        """
+        query = '&'.join(
+            f'{name}={value}'
+            for name, values in sorted(self.request.query_params.lists())
+            for value in values
+        )
+        return 'reference:{version}:{format}:{request}'.format(
+            version=get_version(REFERENCE_VERSION),
+            format=self.request.accepted_renderer.format,
+            request=hashlib.md5(
+                f'{self.request.path}?{query}'.encode()
+            ).hexdigest()
+        )
+
+    def get_cached_response(self, handler, *args, **kwargs) -> Response:
+        if any(
+            param in self.request.query_params
+            for param in self.cache_bypass_params
+        ):
+            return handler(self.request, *args, **kwargs)
+        cache_key = self.get_cache_key()
+        etag = '"{}"'.format(hashlib.md5(cache_key.encode()).hexdigest())
+        if etag in self.request.headers.get('If-None-Match', ''):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            data = cache.get(cache_key)
+            if data is None:
+                response = handler(self.request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                cache.set(
+                    cache_key, response.data,
+                    settings.REFERENCE_CACHE_TIMEOUT
+                )
+            else:
+                response = Response(data)
+        response['ETag'] = etag
+        patch_cache_control(
+            response, public=True, max_age=settings.REFERENCE_CACHE_MAX_AGE
+        )
+        patch_vary_headers(response, ('Accept',))
+        return response
+
+
+class AnonymousCacheMixin:
+    """
+    Миксин для кэширования ответов анонимным пользователям.
+
+    Запись в кэше хранит версии данных, из которых построен ответ,
+    и считается свежей, пока версии не изменились и не истек
+    RESPONSE_CACHE_TIMEOUT. Устаревшую запись пересчитывает только
+    один процесс, взявший блокировку, остальные в это время получают
+    устаревший ответ.
+    """
+
+    def get_cache_dependencies(self) -> list:
+        """Версии данных, от которых зависит ответ до его построения."""
+        return [REFERENCE_VERSION]
+
+    def get_response_dependencies(self, data) -> list:
+        """Версии данных, которые становятся известны из ответа."""
+        return []
+
+    def get_anonymous_cache_key(self) -> str:
+        """
+        Ключ из схемы, хоста, пути и параметров: ответ содержит
+        абсолютные адреса изображений и ссылки на страницы.
+        """
+        query = '&'.join(
+            f'{name}={value}'
+            for name, values in sorted(self.request.query_params.lists())
+            for value in sorted(values)
+        )
+        request = '{scheme}://{host}{path}?{query}'.format(
+            scheme=self.request.scheme,
+            host=self.request.get_host(),
+            path=self.request.path,
+            query=query
+        )
+        return f'response:{hashlib.md5(request.encode()).hexdigest()}'
+
+    def get_anonymous_response(self, handler, *args, **kwargs) -> Response:
+        if not self.request.user.is_anonymous:
+            return handler(self.request, *args, **kwargs)
+        key = self.get_anonymous_cache_key()
+        entry = cache.get(key)
+        if entry is not None and entry['expires'] > time.time() and (
+            get_versions(entry['versions']) == entry['versions']
+        ):
+            return self.cached_response(entry, 'HIT')
+        lock_key = f'{key}:lock'
+        locked = cache.add(
+            lock_key, True, settings.RESPONSE_CACHE_LOCK_TIMEOUT
+        )
+        if not locked:
+            if entry is not None:
+                return self.cached_response(entry, 'STALE')
+            entry = self.wait_for_entry(key)
+            if entry is not None:
+                return self.cached_response(entry, 'HIT')
+        try:
+            versions = get_versions(self.get_cache_dependencies())
+            response = handler(self.request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                versions.update(get_versions(
+                    self.get_response_dependencies(response.data)
+                ))
+                cache.set(key, {
+                    'versions': versions,
+                    'expires': time.time() + settings.RESPONSE_CACHE_TIMEOUT,
+                    'data': response.data,
+                }, settings.RESPONSE_CACHE_STALE_TIMEOUT)
+        finally:
+            if locked:
+                cache.delete(lock_key)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def wait_for_entry(self, key: str):
+        """
+        Ждет, пока процесс с блокировкой построит ответ, которого
+        в кэше еще нет.
+        """
+        deadline = time.monotonic() + settings.RESPONSE_CACHE_LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry
+        return None
+
+    def cached_response(self, entry, state: str) -> Response:
+        response = Response(entry['data'])
+        response['X-Cache'] = state
+        return response
+
+
+class CursorPaginationMixin:
+    """
+    Миксин для включения курсорной пагинации по запросу.
+
+    Если в запросе есть параметр cursor (для первой страницы - пустой),
+    используется cursor_pagination_class вместо pagination_class.
+    Параметры из cursor_bypass_params задают свой порядок выдачи,
+    несовместимый с ключом курсора: с ними cursor игнорируется.
+    """
+    cursor_pagination_class = None
+    cursor_bypass_params = ()
+
+    def use_cursor_pagination(self) -> bool:
+        params = self.request.query_params
+        return (
+            self.cursor_pagination_class is not None
+            and self.cursor_pagination_class.cursor_query_param in params
+            and not any(param in params for param in self.cursor_bypass_params)
+        )
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.use_cursor_pagination():
+                self._paginator = self.cursor_pagination_class()
+            elif self.pagination_class is None:
+                self._paginator = None
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
 
 class AmountMixin:
@@ -22,20 +216,40 @@ class AmountMixin:
     Миксин для работы с количеством ингредиентов.
     """
 
-    def update_or_create_ingredient(self, recipe, ingredients: list) -> None:
+    def update_or_create_ingredient(self, recipe, ingredients: list) -> bool:
         """
-        Обновляет или создает ингредиенты для рецепта.
+        Приводит ингредиенты рецепта к переданному списку.
+
+        Сравнивает список с текущими строками и выполняет только нужные
+        вставки, обновления количества и удаления. Возвращает True,
+        если состав рецепта изменился.
         """
-        recipe.ingredients.clear()
-        ingredient_list = [
-            AmountIngredient(
-                recipe=recipe,
-                ingredient_id=ingredient['id'].id,
-                amount=ingredient['amount']
-            )
-            for ingredient in ingredients
-        ]
-        AmountIngredient.objects.bulk_create(ingredient_list)
+        current = {
+            amount.ingredient_id: amount
+            for amount in AmountIngredient.objects.filter(recipe=recipe)
+        }
+        to_create = []
+        to_update = []
+        for ingredient in ingredients:
+            amount = current.pop(ingredient['id'].id, None)
+            if amount is None:
+                to_create.append(AmountIngredient(
+                    recipe=recipe,
+                    ingredient_id=ingredient['id'].id,
+                    amount=ingredient['amount']
+                ))
+            elif amount.amount != ingredient['amount']:
+                amount.amount = ingredient['amount']
+                to_update.append(amount)
+        if current:
+            AmountIngredient.objects.filter(
+                pk__in=[amount.pk for amount in current.values()]
+            ).delete()
+        if to_update:
+            AmountIngredient.objects.bulk_update(to_update, ['amount'])
+        if to_create:
+            AmountIngredient.objects.bulk_create(to_create)
+        return bool(current or to_create)
 
 
 class ChosenMixin():
@@ -47,9 +261,30 @@ class ChosenMixin():
         """
         Метод получения статуса выбранного рецепта.
 
-        Используется для избранного и списка покупок.
+        Используется для избранного и списка покупок. Статус берется
+        из состояния пользователя, загружаемого один раз за запрос.
         """
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
-        return model.objects.filter(user=user, recipe=obj).exists()
+        state = get_user_state(self.context.get('request'))
+        return obj.pk in state.recipe_ids(model)
+
+
+class TimedSerializerMixin:
+    """
+    Миксин сериализатора, который учитывает время сериализации
+    в статистике запроса.
+
+    Вложенные сериализаторы не учитываются повторно.
+    """
+
+    def to_representation(self, instance):
+        stats = current_stats.get()
+        if stats is None:
+            return super().to_representation(instance)
+        stats.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            stats.serializer_depth -= 1
+            if not stats.serializer_depth:
+                stats.serializer_time += time.perf_counter() - started
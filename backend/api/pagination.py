@@ -0,0 +1,153 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор с оценкой числа строк для больших таблиц.
+
+    Для нефильтрованной выборки в PostgreSQL число строк берется
+    из статистики планировщика вместо полного COUNT(*).
+    Маленькие таблицы и отфильтрованные выборки считаются точно.
+    """
+
+    @cached_property
+    def count(self) -> int:
+        estimate = self.get_estimate()
+        if estimate is not None and (
+            estimate > settings.ESTIMATED_COUNT_THRESHOLD
+        ):
+            return estimate
+        return super().count
+
+    def get_estimate(self):
+        queryset = self.object_list
+        if not hasattr(queryset, 'query') or queryset.query.where:
+            return None
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE relname = %s',
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        if not row or row[0] < 0:
+            return None
+        return int(row[0])
+
+
+class KeysetPagination(BasePagination):
+    """
+    Курсорная (keyset) пагинация.
+
+    Позиция страницы кодируется значениями полей сортировки последнего
+    объекта, и следующая страница выбирается условием по этим полям,
+    без OFFSET и COUNT(*). Стоимость запроса не зависит от глубины.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering = ('-pk',)
+    invalid_cursor_message = 'Неверный курсор'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(position))
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_page_size(self, request) -> int:
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_position_filter(self, position) -> Q:
+        """
+        Условие «строго после позиции» для составного ключа сортировки.
+        """
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def get_fields(self, model):
+        return [
+            model._meta.pk if field.lstrip('-') == 'pk'
+            else model._meta.get_field(field.lstrip('-'))
+            for field in self.ordering
+        ]
+
+    def decode_cursor(self, model):
+        encoded = self.request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(urlsafe_b64decode(encoded.encode()))
+            fields = self.get_fields(model)
+            if len(values) != len(fields):
+                raise ValueError
+            return [
+                field.to_python(value) for field, value in zip(fields, values)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, obj) -> str:
+        values = [
+            field.value_to_string(obj) for field in self.get_fields(type(obj))
+        ]
+        return urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.page[-1])
+        )
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', None),
+            ('results', data),
+        ]))
+
+
+class RecipeCursorPagination(KeysetPagination):
+    ordering = ('-pub_date', '-pk')
+
+
+class IdCursorPagination(KeysetPagination):
+    ordering = ('pk',)
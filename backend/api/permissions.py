@@ -1,3 +1,6 @@
+import hmac
+
+from django.conf import settings
 from rest_framework import permissions
 from rest_framework.request import Request
 from rest_framework.views import APIView
@@ -21,3 +24,18 @@ class IsAuthorOrReadOnly(permissions.BasePermission):
             request.method in permissions.SAFE_METHODS
             or request.user == obj.author
         )
+
+
+class IsStaffOrMetricsToken(permissions.BasePermission):
+    """
+    Доступ к метрикам для персонала или по заголовку
+    Authorization: Bearer <METRICS_TOKEN>.
+    """
+
+    def has_permission(self, request: Request, view: APIView) -> bool:
+        if request.user.is_staff:
+            return True
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        return bool(settings.METRICS_TOKEN) and hmac.compare_digest(
+            header, f'Bearer {settings.METRICS_TOKEN}'
+        )
@@ -0,0 +1,166 @@
+import glob
+import json
+import os
+import pstats
+import re
+import threading
+import time
+import uuid
+from cProfile import Profile
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_PARAM = 'profile'
+PROFILE_ID = re.compile(r'^\d+-[0-9a-f]{12}$')
+
+profile_lock = threading.Lock()
+
+
+def profile_requested(request) -> bool:
+    """Запрошено ли профилирование заголовком X-Profile или ?profile=1."""
+    value = request.META.get(PROFILE_HEADER) or request.GET.get(
+        PROFILE_PARAM
+    )
+    return value is not None and value.lower() in ('1', 'true')
+
+
+def is_staff_request(request) -> bool:
+    """
+    Проверяет, что запрос сделан персоналом.
+
+    Middleware работает до аутентификации DRF, поэтому пользователь
+    определяется теми же классами аутентификации, что и в API.
+    """
+    drf_request = Request(request, authenticators=[
+        authenticator()
+        for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    ])
+    try:
+        return drf_request.user.is_staff
+    except APIException:
+        return False
+
+
+def profile_path(profile_id: str, extension: str) -> str:
+    return os.path.join(settings.PROFILE_DIR, f'{profile_id}.{extension}')
+
+
+def function_name(key) -> str:
+    filename, line, name = key
+    return f'{filename}:{line}({name})' if line else name
+
+
+def save_profile(profiler: Profile, request, response,
+                 elapsed: float) -> str:
+    """
+    Сохраняет дамп pstats и сводку: самые долгие функции по общему
+    времени и хронологию SQL-запросов. Возвращает id профиля.
+    """
+    profile_id = f'{int(time.time())}-{uuid.uuid4().hex[:12]}'
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(profile_path(profile_id, 'prof'))
+    stats = pstats.Stats(profiler)
+    functions = sorted(
+        stats.stats.items(), key=lambda item: item[1][3], reverse=True
+    )[:settings.PROFILE_TOP]
+    request_stats = getattr(request, 'stats', None)
+    queries = request_stats.queries if request_stats else []
+    summary = {
+        'id': profile_id,
+        'method': request.method,
+        'path': request.get_full_path(),
+        'status': response.status_code,
+        'total_ms': round(elapsed * 1000, 1),
+        'sql_ms': round(sum(duration for _, duration, _ in queries) * 1000, 1),
+        'functions': [
+            {
+                'function': function_name(key),
+                'calls': calls,
+                'primitive_calls': primitive_calls,
+                'own_ms': round(own_time * 1000, 3),
+                'cumulative_ms': round(cumulative_time * 1000, 3),
+            }
+            for key, (primitive_calls, calls, own_time, cumulative_time, _)
+            in functions
+        ],
+        'sql': [
+            {
+                'offset_ms': round(offset * 1000, 3),
+                'duration_ms': round(duration * 1000, 3),
+                'sql': sql,
+            }
+            for offset, duration, sql in queries
+        ],
+    }
+    with open(profile_path(profile_id, 'json'), 'w') as file:
+        json.dump(summary, file, ensure_ascii=False)
+    prune_profiles()
+    return profile_id
+
+
+def prune_profiles() -> None:
+    """Оставляет только PROFILE_KEEP последних профилей."""
+    summaries = sorted(
+        glob.glob(os.path.join(settings.PROFILE_DIR, '*.json')),
+        key=os.path.getmtime, reverse=True
+    )
+    for path in summaries[settings.PROFILE_KEEP:]:
+        for extension in ('json', 'prof'):
+            try:
+                os.remove(f'{os.path.splitext(path)[0]}.{extension}')
+            except FileNotFoundError:
+                pass
+
+
+def load_profile(profile_id: str) -> Optional[Dict[str, Any]]:
+    if not PROFILE_ID.match(profile_id):
+        return None
+    try:
+        with open(profile_path(profile_id, 'json')) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+class ProfilingMiddleware:
+    """
+    Профилирует отдельный запрос персонала через cProfile.
+
+    Профилирование включается заголовком X-Profile: 1 или параметром
+    ?profile=1. Одновременно профилируется только один запрос, остальные
+    обрабатываются как обычно. Id сохраненного профиля возвращается
+    в заголовке X-Profile-Id, сам профиль доступен по /api/profiles/<id>/.
+    Должен стоять после InstrumentationMiddleware, чтобы в профиль попала
+    хронология SQL-запросов.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not (profile_requested(request) and is_staff_request(request)):
+            return self.get_response(request)
+        if not profile_lock.acquire(blocking=False):
+            response = self.get_response(request)
+            response['X-Profile-Id'] = 'busy'
+            return response
+        try:
+            profiler = Profile()
+            started = time.perf_counter()
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+            elapsed = time.perf_counter() - started
+            response['X-Profile-Id'] = save_profile(
+                profiler, request, response, elapsed
+            )
+        finally:
+            profile_lock.release()
+        return response
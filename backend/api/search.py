@@ -0,0 +1,159 @@
+import re
+from collections import Counter
+from typing import Dict, Iterable, List
+
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Sum
+
+from api.constants import SEARCH_TERM_LENGHT
+from recipes.models import AmountIngredient, Recipe, RecipeSearchTerm
+
+# Веса полей рецепта в поисковом индексе.
+NAME_WEIGHT = 3
+INGREDIENT_WEIGHT = 2
+TEXT_WEIGHT = 1
+
+WORD = re.compile(r'\w+')
+
+STOP_WORDS = frozenset((
+    'а', 'без', 'в', 'во', 'да', 'для', 'до', 'же', 'за', 'и', 'из', 'или',
+    'к', 'ко', 'как', 'ли', 'на', 'над', 'не', 'ни', 'но', 'о', 'об', 'от',
+    'по', 'под', 'при', 'про', 'с', 'со', 'то', 'у', 'что', 'это',
+))
+
+VOWELS = 'аеиоуыэюя'
+RV = re.compile(rf'^(.*?[{VOWELS}])(.*)$')
+PERFECTIVE_GERUND = re.compile(
+    r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$'
+)
+REFLEXIVE = re.compile(r'(с[яь])$')
+ADJECTIVE = re.compile(
+    r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|'
+    r'ую|юю|ая|яя|ою|ею)$'
+)
+PARTICIPLE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+VERB = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|'
+    r'ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)|'
+    r'((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$'
+)
+NOUN = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|'
+    r'ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+)
+DERIVATIONAL = re.compile(rf'.*[^{VOWELS}]+[{VOWELS}].*ость?$')
+DERIVATIONAL_SUFFIX = re.compile(r'ость?$')
+SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+
+
+def stem(word: str) -> str:
+    """
+    Основа русского слова по алгоритму стемминга Портера (Snowball).
+    """
+    word = word.replace('ё', 'е')
+    match = RV.match(word)
+    if not match:
+        return word
+    prefix, rv = match.groups()
+    stripped = PERFECTIVE_GERUND.sub('', rv, 1)
+    if stripped == rv:
+        rv = REFLEXIVE.sub('', rv, 1)
+        stripped = ADJECTIVE.sub('', rv, 1)
+        if stripped != rv:
+            rv = PARTICIPLE.sub('', stripped, 1)
+        else:
+            stripped = VERB.sub('', rv, 1)
+            rv = NOUN.sub('', rv, 1) if stripped == rv else stripped
+    else:
+        rv = stripped
+    if rv.endswith('и'):
+        rv = rv[:-1]
+    if DERIVATIONAL.match(rv):
+        rv = DERIVATIONAL_SUFFIX.sub('', rv, 1)
+    if rv.endswith('ь'):
+        rv = rv[:-1]
+    else:
+        rv = SUPERLATIVE.sub('', rv, 1)
+        if rv.endswith('нн'):
+            rv = rv[:-1]
+    return prefix + rv
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Разбивает текст на основы слов без стоп-слов.
+    """
+    return [
+        stem(word)[:SEARCH_TERM_LENGHT]
+        for word in WORD.findall(text.lower())
+        if word not in STOP_WORDS and not word.isdigit()
+    ]
+
+
+def recipe_terms(
+        name: str, text: str, ingredients: Iterable[str]
+) -> Dict[str, int]:
+    """
+    Веса основ слов рецепта с учетом поля, в котором они встретились.
+    """
+    weights = Counter()
+    for term in tokenize(name):
+        weights[term] += NAME_WEIGHT
+    for ingredient in ingredients:
+        for term in tokenize(ingredient):
+            weights[term] += INGREDIENT_WEIGHT
+    for term in tokenize(text):
+        weights[term] += TEXT_WEIGHT
+    return weights
+
+
+def index_recipe(recipe_id: int) -> None:
+    """
+    Перестраивает записи обратного индекса одного рецепта.
+    """
+    recipe = Recipe.objects.filter(pk=recipe_id).values(
+        'name', 'text'
+    ).first()
+    with transaction.atomic():
+        RecipeSearchTerm.objects.filter(recipe_id=recipe_id).delete()
+        if recipe is None:
+            return
+        ingredients = AmountIngredient.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('ingredient__name', flat=True)
+        RecipeSearchTerm.objects.bulk_create(
+            RecipeSearchTerm(recipe_id=recipe_id, term=term, weight=weight)
+            for term, weight in recipe_terms(
+                recipe['name'], recipe['text'], ingredients
+            ).items()
+        )
+
+
+def schedule_index(recipe_id: int) -> None:
+    """
+    Переиндексирует рецепт после фиксации текущей транзакции.
+    """
+    transaction.on_commit(lambda: index_recipe(recipe_id))
+
+
+def search_recipes(queryset, query: str):
+    """
+    Отбирает рецепты, содержащие все слова запроса, по убыванию релевантности.
+
+    Релевантность - сумма весов совпавших основ слов.
+    """
+    terms = set(tokenize(query))
+    if not terms:
+        return queryset.none()
+    matches = RecipeSearchTerm.objects.filter(
+        term__in=terms
+    ).values('recipe').annotate(
+        matched=Count('term'), score=Sum('weight')
+    ).filter(matched=len(terms))
+    return queryset.filter(
+        pk__in=matches.values('recipe')
+    ).annotate(
+        search_rank=Subquery(
+            matches.filter(recipe=OuterRef('pk')).values('score')
+        )
+    ).order_by('-search_rank', '-pub_date', '-pk')
@@ -1,13 +1,23 @@
 import base64
+import binascii
 import re
-from typing import Any, Dict
+import tempfile
+from typing import Any, Dict, Optional
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.base import File
+from django.db import transaction
+from PIL import Image
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
-
-from api.constants import MAX_VALUE, MIN_VALUE, NAME_LENGHT
-from api.mixins import AmountMixin, ChosenMixin
+from rest_framework.relations import MANY_RELATION_KWARGS
+
+from api.constants import (BASE64_CHUNK_SIZE, MAX_VALUE, MIN_VALUE,
+                           NAME_LENGHT)
+from api.images import variant_urls
+from api.indexes import recipe_ingredient_index
+from api.mixins import AmountMixin, ChosenMixin, TimedSerializerMixin
+from api.state import get_user_state
 from recipes.models import (AmountIngredient, Favorite, Ingredient, Recipe,
                             ShopingList, Subscription, Tag)
 from users.models import User
@@ -16,16 +26,141 @@ from users.models import User
 class Base64ImageField(serializers.ImageField):
     """
     Поле для обработки изображений в формате base64.
+
+    Строка декодируется частями во временный файл, который держится
+    в памяти только до IMAGE_SPOOL_SIZE байт. Размер файла и размеры
+    изображения проверяются до полного декодирования картинки.
     """
+    BASE64_MARKER = ';base64,'
 
-    def to_internal_value(self, data: str) -> ContentFile:
+    def to_internal_value(self, data: str) -> File:
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = self.decode(data)
 
         return super().to_internal_value(data)
 
+    def decode(self, data: str) -> File:
+        header_end = data.find(self.BASE64_MARKER)
+        if header_end == -1:
+            raise ValidationError('Некорректный формат изображения')
+        ext = data[:header_end].split('/')[-1]
+        start = header_end + len(self.BASE64_MARKER)
+        if (len(data) - start) * 3 // 4 > settings.MAX_IMAGE_UPLOAD_SIZE:
+            raise ValidationError(
+                'Размер изображения превышает '
+                f'{settings.MAX_IMAGE_UPLOAD_SIZE} байт'
+            )
+        file = tempfile.SpooledTemporaryFile(
+            max_size=settings.IMAGE_SPOOL_SIZE
+        )
+        try:
+            # Пробельные символы (переносы строк MIME) отбрасываются,
+            # а хвост части, не кратный 4 символам, переходит в следующую:
+            # validate=True проверяет только алфавит base64.
+            rest = ''
+            for offset in range(start, len(data), BASE64_CHUNK_SIZE):
+                chunk = rest + ''.join(
+                    data[offset:offset + BASE64_CHUNK_SIZE].split()
+                )
+                end = len(chunk) - len(chunk) % 4
+                file.write(base64.b64decode(chunk[:end], validate=True))
+                rest = chunk[end:]
+            if rest:
+                base64.b64decode(rest, validate=True)
+        except binascii.Error:
+            file.close()
+            raise ValidationError('Некорректные данные base64')
+        file.seek(0)
+        try:
+            self.check_dimensions(file)
+        except ValidationError:
+            file.close()
+            raise
+        file.seek(0)
+        return File(file, name='temp.' + ext)
+
+    def check_dimensions(self, file) -> None:
+        """
+        Проверяет размеры изображения по заголовку файла.
+        """
+        try:
+            with Image.open(file) as image:
+                width, height = image.size
+        except Exception:
+            raise ValidationError('Загрузите корректное изображение')
+        if (
+            max(width, height) > settings.MAX_IMAGE_DIMENSION
+            or width * height > settings.MAX_IMAGE_PIXELS
+        ):
+            raise ValidationError(
+                f'Изображение {width}x{height} слишком большое'
+            )
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """
+    Поле с адресами миниатюр и WebP-версий изображения.
+    """
+
+    def to_representation(self, value) -> Optional[Dict[str, str]]:
+        if not value:
+            return None
+        request = self.context.get('request')
+        urls = variant_urls(value)
+        if request is not None:
+            urls = {
+                variant: request.build_absolute_uri(url)
+                for variant, url in urls.items()
+            }
+        return urls
+
+
+def resolve_ids(queryset, ids: list) -> list:
+    """
+    Находит объекты по списку id одним запросом.
+
+    Возвращает объекты в порядке id; если какие-то id не найдены,
+    сообщает обо всех сразу.
+    """
+    try:
+        ids = [int(pk) for pk in ids]
+    except (TypeError, ValueError):
+        raise ValidationError('Id должны быть целыми числами')
+    objects = queryset.in_bulk(set(ids))
+    missing = [str(pk) for pk in dict.fromkeys(ids) if pk not in objects]
+    if missing:
+        raise ValidationError(
+            f'Не найдены {queryset.model._meta.verbose_name_plural} '
+            f'с id: {", ".join(missing)}'
+        )
+    return [objects[pk] for pk in ids]
+
+
+class BatchManyRelatedField(serializers.ManyRelatedField):
+    """Список связанных объектов, которые находятся одним запросом."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        return resolve_ids(self.child_relation.get_queryset(), data)
+
+
+class BatchPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField, который при many=True находит все объекты
+    одним запросом.
+    """
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BatchManyRelatedField(**list_kwargs)
+
 
 class SignUpSerializer(serializers.ModelSerializer):
     """
@@ -69,7 +204,7 @@ class SignUpSerializer(serializers.ModelSerializer):
         return User.objects.create_user(**validated_data)
 
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Сериализатор данных модели User.
 
@@ -77,29 +212,25 @@ class UserProfileSerializer(serializers.ModelSerializer):
     """
     is_subscribed = serializers.SerializerMethodField()
     avatar = Base64ImageField(required=False, allow_null=True)
+    avatar_variants = ImageVariantsField(source='avatar')
 
     class Meta:
         model = User
         fields = ('email', 'id', 'username', 'first_name',
-                  'last_name', 'is_subscribed', 'avatar')
+                  'last_name', 'is_subscribed', 'avatar', 'avatar_variants')
 
     def get_is_subscribed(self, obj: User) -> bool:
-        user = self.context['request'].user
-        if not user or user.is_anonymous:
-            return False
-        if user == obj:
-            return False
-        return user.subscriptions.filter(author=obj).exists()
+        return obj.pk in get_user_state(self.context.get('request')).following
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор данных модели Tag."""
     class Meta:
         model = Tag
         fields = ('id', 'name', 'slug')
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор данных модели Ingredient."""
     class Meta:
         model = Ingredient
@@ -118,9 +249,22 @@ class AmountIngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount', 'measurement_unit', 'name')
 
 
+class AddIngredientListSerializer(serializers.ListSerializer):
+    """Список ингредиентов рецепта, которые находятся одним запросом."""
+
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        ingredients = resolve_ids(
+            Ingredient.objects.all(), [item['id'] for item in items]
+        )
+        for item, ingredient in zip(items, ingredients):
+            item['id'] = ingredient
+        return items
+
+
 class AddIngredientSerializer(serializers.ModelSerializer):
     """Сериализатор данных для добавления ингредиентов в рецепт."""
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = serializers.IntegerField()
     amount = serializers.IntegerField(
         min_value=MIN_VALUE,
         max_value=MAX_VALUE
@@ -129,9 +273,12 @@ class AddIngredientSerializer(serializers.ModelSerializer):
     class Meta:
         model = AmountIngredient
         fields = ('id', 'amount')
+        list_serializer_class = AddIngredientListSerializer
 
 
-class RecipeGetSerializer(serializers.ModelSerializer, ChosenMixin):
+class RecipeGetSerializer(
+    TimedSerializerMixin, serializers.ModelSerializer, ChosenMixin
+):
     """Сериализатор данных модели Recipe для GET-запросов."""
     tags = TagSerializer(many=True)
     author = UserProfileSerializer(read_only=True)
@@ -141,6 +288,7 @@ class RecipeGetSerializer(serializers.ModelSerializer, ChosenMixin):
     is_in_shopping_cart = serializers.SerializerMethodField()
     name = serializers.CharField()
     image = Base64ImageField()
+    image_variants = ImageVariantsField(source='image')
     text = serializers.CharField()
     cooking_time = serializers.IntegerField(
         min_value=MIN_VALUE,
@@ -151,7 +299,8 @@ class RecipeGetSerializer(serializers.ModelSerializer, ChosenMixin):
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time'
+            'is_in_shopping_cart', 'name', 'image', 'image_variants', 'text',
+            'cooking_time'
         )
         read_only_fields = ('author',)
 
@@ -162,10 +311,21 @@ class RecipeGetSerializer(serializers.ModelSerializer, ChosenMixin):
         return self.get_chosen_recipe(obj, ShopingList)
 
 
+class RecipeMatchSerializer(RecipeGetSerializer):
+    """Рецепт, подобранный по имеющимся ингредиентам."""
+    missing_ingredients = serializers.IntegerField(read_only=True)
+    coverage = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeGetSerializer.Meta):
+        fields = RecipeGetSerializer.Meta.fields + (
+            'missing_ingredients', 'coverage'
+        )
+
+
 class RecipeSerializer(serializers.ModelSerializer, AmountMixin, ChosenMixin):
     """Сериализатор данных для создания рецепта."""
     ingredients = AddIngredientSerializer(required=True, many=True)
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BatchPrimaryKeyRelatedField(
         queryset=Tag.objects.all(), many=True)
     image = Base64ImageField()
     author = serializers.HiddenField(default=serializers.CurrentUserDefault())
@@ -182,6 +342,8 @@ class RecipeSerializer(serializers.ModelSerializer, AmountMixin, ChosenMixin):
     def validate(self, data: Dict[str, Any]) -> Dict[str, Any]:
         unique_data: set[int] = set()
         for model in ('ingredients', 'tags'):
+            if self.partial and model not in data:
+                continue
             if not data.get(model):
                 raise ValidationError(f'Укажите {model}')
             for obj in data.get(model):
@@ -197,24 +359,36 @@ class RecipeSerializer(serializers.ModelSerializer, AmountMixin, ChosenMixin):
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
-        recipe = Recipe.objects.create(**validated_data)
-        self.update_or_create_ingredient(
-            recipe=recipe, ingredients=ingredients
-        )
-        recipe.tags.set(tags)
+        with transaction.atomic():
+            recipe = Recipe.objects.create(**validated_data)
+            self.update_or_create_ingredient(
+                recipe=recipe, ingredients=ingredients
+            )
+            recipe.tags.set(tags)
+            recipe_ingredient_index.schedule_update(
+                recipe.pk, (item['id'].id for item in ingredients))
         return recipe
 
     def update(
             self,
             instance: Recipe,
             validated_data: Dict[str, Any]) -> Recipe:
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
-        self.update_or_create_ingredient(
-            recipe=instance, ingredients=ingredients)
-        instance.tags.clear()
-        instance.tags.set(tags)
-        super().update(instance, validated_data)
+        """
+        Обновляет рецепт, изменяя только отличающиеся связи.
+
+        Ингредиенты и теги, не переданные в запросе, не затрагиваются.
+        """
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        with transaction.atomic():
+            if ingredients is not None and self.update_or_create_ingredient(
+                recipe=instance, ingredients=ingredients
+            ):
+                recipe_ingredient_index.schedule_update(
+                    instance.pk, (item['id'].id for item in ingredients))
+            if tags is not None:
+                instance.tags.set(tags)
+            super().update(instance, validated_data)
         return instance
 
     def to_representation(self, instance: Recipe) -> Dict[str, Any]:
@@ -230,13 +404,15 @@ class RecipeSerializer(serializers.ModelSerializer, AmountMixin, ChosenMixin):
         return self.get_chosen_recipe(obj, ShopingList)
 
 
-class RecipeMiniSerializer(serializers.ModelSerializer):
+class RecipeMiniSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    image_variants = ImageVariantsField(source='image')
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time',)
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time',)
 
 
-class SubscribeSerializer(serializers.ModelSerializer):
+class SubscribeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор модели Subscriber."""
     email = serializers.ReadOnlyField(source='author.email')
     id = serializers.ReadOnlyField(source='author.id')
@@ -244,16 +420,17 @@ class SubscribeSerializer(serializers.ModelSerializer):
     first_name = serializers.ReadOnlyField(source='author.first_name')
     last_name = serializers.ReadOnlyField(source='author.last_name')
     is_subscribed = serializers.SerializerMethodField()
-    recipes = RecipeMiniSerializer(
-        read_only=True, many=True, source='author.recipe')
-    recipes_count = serializers.SerializerMethodField()
+    recipes = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField(source='author.recipes_count')
     avatar = Base64ImageField(source='author.avatar',
                               required=False, allow_null=True)
+    avatar_variants = ImageVariantsField(source='author.avatar')
 
     class Meta:
         model = Subscription
         fields = ('email', 'id', 'username', 'first_name', 'last_name',
-                  'is_subscribed', 'recipes', 'recipes_count', 'avatar')
+                  'is_subscribed', 'recipes', 'recipes_count', 'avatar',
+                  'avatar_variants')
 
     def validate(self, data: Dict[str, Any]) -> Dict[str, Any]:
         if self.context['user'] == self.context['author']:
@@ -263,20 +440,30 @@ class SubscribeSerializer(serializers.ModelSerializer):
         return data
 
     def get_is_subscribed(self, obj: Subscription) -> bool:
-        if not obj.user:
-            return False
-        return obj.user.subscriptions.filter(author=obj.author).exists()
-
-    def to_representation(self, instance: Subscription) -> Dict[str, Any]:
-        representation = super().to_representation(instance)
-        recipes_limit = self.context['request'].GET.get('recipes_limit')
-        if recipes_limit:
-            representation['recipes'] = representation['recipes'][:int(
-                recipes_limit)]
-        return representation
-
-    def get_recipes_count(self, obj: Subscription) -> int:
-        return obj.author.recipe.count()
+        """Сохраненная подписка всегда означает, что подписка есть."""
+        return obj.pk is not None
+
+    def get_recipes(self, obj: Subscription) -> list:
+        recipes = getattr(obj.author, 'limited_recipes', None)
+        if recipes is None:
+            recipes = obj.author.recipe.all()
+            recipes_limit = self.context.get('recipes_limit')
+            if recipes_limit:
+                recipes = recipes[:recipes_limit]
+        return RecipeMiniSerializer(
+            recipes, many=True, context=self.context).data
+
+
+class BatchSerializer(serializers.Serializer):
+    """Список id для пакетного добавления или удаления."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BATCH_MAX_SIZE
+    )
+
+    def validate_ids(self, value: list) -> list:
+        return list(dict.fromkeys(value))
 
 
 class SetPasswordSerializer(serializers.Serializer):
@@ -1,39 +1,167 @@
-from django.http import HttpResponse
+import csv
+import json
+
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
+from django.db.models.signals import post_save
+from django.http import StreamingHttpResponse
 
 from recipes.models import AmountIngredient
 
+SHOPPING_LIST_TITLE = 'Список покупок'
+BATCH_ADD_ATTEMPTS = 3
+SHOPPING_LIST_CONTENT_TYPES = {
+    'txt': 'text/plain; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+    'json': 'application/json',
+}
+
 
-def shopping_list_txt(user) -> HttpResponse:
+class Echo:
     """
-    Функция скачивания текстового файла списка ингредиентов.
+    Буфер, который возвращает записанную строку вместо ее хранения.
+
+    Позволяет использовать csv.writer для потоковой выдачи.
     """
-    text_shop_list = 'Список покупок \n\n'
-    measurement_unit = {}
-    ingredient_amount = {}
 
-    ingredients = AmountIngredient.objects.filter(
+    def write(self, value: str) -> str:
+        return value
+
+
+def get_shopping_list(user):
+    """
+    Суммирует ингредиенты из списка покупок пользователя в базе данных.
+    """
+    return AmountIngredient.objects.filter(
         recipe__shoping_list__user=user
     ).values(
-        'ingredient__name', 'ingredient__measurement_unit', 'amount'
-    )
+        'ingredient__name', 'ingredient__measurement_unit'
+    ).annotate(
+        total_amount=Sum('amount')
+    ).order_by('ingredient__name')
+
 
+def shopping_list_txt(ingredients):
+    yield f'{SHOPPING_LIST_TITLE} \n\n'
     for ingredient in ingredients:
-        name = ingredient['ingredient__name']
-        unit = ingredient['ingredient__measurement_unit']
-        amount = ingredient['amount']
+        yield (
+            f'{ingredient["ingredient__name"]} - '
+            f'{ingredient["total_amount"]} '
+            f'{ingredient["ingredient__measurement_unit"]}\n'
+        )
 
-        if name in ingredient_amount:
-            ingredient_amount[name] += amount
-        else:
-            measurement_unit[name] = unit
-            ingredient_amount[name] = amount
 
-    for name, amount in ingredient_amount.items():
-        text_shop_list += f'{name} - {amount} {measurement_unit[name]}\n'
+def shopping_list_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'amount', 'measurement_unit'))
+    for ingredient in ingredients:
+        yield writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['total_amount'],
+            ingredient['ingredient__measurement_unit'],
+        ))
+
+
+def shopping_list_json(ingredients):
+    yield '['
+    separator = ''
+    for ingredient in ingredients:
+        yield separator + json.dumps({
+            'name': ingredient['ingredient__name'],
+            'amount': ingredient['total_amount'],
+            'measurement_unit': ingredient['ingredient__measurement_unit'],
+        }, ensure_ascii=False)
+        separator = ','
+    yield ']'
+
+
+SHOPPING_LIST_FORMATS = {
+    'txt': shopping_list_txt,
+    'csv': shopping_list_csv,
+    'json': shopping_list_json,
+}
+
 
-    response = HttpResponse(text_shop_list, content_type='text/plain')
+def shopping_list_response(user, file_format='txt') -> StreamingHttpResponse:
+    """
+    Функция скачивания списка ингредиентов.
+
+    Ингредиенты агрегируются в базе данных, а файл отдается потоком,
+    поэтому расход памяти не зависит от размера списка покупок.
+    """
+    ingredients = get_shopping_list(user).iterator()
+    response = StreamingHttpResponse(
+        SHOPPING_LIST_FORMATS[file_format](ingredients),
+        content_type=SHOPPING_LIST_CONTENT_TYPES[file_format]
+    )
     response['Content-Disposition'] = (
-        'attachment; filename="shopping_list.txt"'
+        f'attachment; filename="shopping_list.{file_format}"'
     )
-
     return response
+
+
+def batch_add(user, model, field: str, ids, found_ids) -> list:
+    """
+    Добавляет пользователю связи с объектами из списка одним запросом.
+
+    Если параллельный запрос успел добавить одну из связей, вставка
+    откатывается до точки сохранения и повторяется с учетом новых
+    связей. Поэтому post_save отправляется и статус added выдается
+    только для действительно созданных связей: счетчики, кэши
+    и ленты обновляются так же, как при одиночном добавлении.
+    Возвращает результат по каждому id.
+    """
+    with transaction.atomic():
+        for attempt in range(BATCH_ADD_ATTEMPTS):
+            existing = set(model.objects.filter(
+                user=user, **{f'{field}__in': found_ids}
+            ).values_list(f'{field}_id', flat=True))
+            created = [
+                model(user=user, **{f'{field}_id': pk})
+                for pk in found_ids if pk not in existing
+            ]
+            try:
+                with transaction.atomic():
+                    model.objects.bulk_create(created)
+                break
+            except IntegrityError:
+                if attempt == BATCH_ADD_ATTEMPTS - 1:
+                    raise
+        for obj in created:
+            post_save.send(
+                sender=model, instance=obj, created=True,
+                update_fields=None, raw=False, using=obj._state.db
+            )
+    results = []
+    for pk in ids:
+        if pk not in found_ids:
+            result = 'not_found'
+        elif pk in existing:
+            result = 'exists'
+        else:
+            result = 'added'
+        results.append({'id': pk, 'status': result})
+    return results
+
+
+def batch_remove(user, model, field: str, ids, found_ids) -> list:
+    """
+    Удаляет связи пользователя с объектами из списка одним запросом.
+
+    Возвращает результат по каждому id.
+    """
+    queryset = model.objects.filter(user=user, **{f'{field}__in': found_ids})
+    with transaction.atomic():
+        existing = set(queryset.values_list(f'{field}_id', flat=True))
+        if existing:
+            queryset.delete()
+    results = []
+    for pk in ids:
+        if pk not in found_ids:
+            result = 'not_found'
+        elif pk in existing:
+            result = 'removed'
+        else:
+            result = 'missing'
+        results.append({'id': pk, 'status': result})
+    return results
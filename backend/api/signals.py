@@ -0,0 +1,152 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from api.cache import (AUTHOR_VERSION, RECIPE_LIST_VERSION, RECIPE_VERSION,
+                       REFERENCE_VERSION, USER_STATE_VERSION, schedule_bump)
+from api.feed import (fan_out_recipe, invalidate_author_feeds,
+                      invalidate_timeline)
+from api.images import schedule_variants
+from api.indexes import (ingredient_index, recipe_ingredient_index,
+                         recipe_tag_index)
+from api.search import schedule_index
+from recipes.models import (AmountIngredient, Favorite, Ingredient, Recipe,
+                            ShopingList, Subscription, Tag)
+from users.models import User
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    ingredient_index.schedule_invalidate()
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+def bump_reference_version(sender, **kwargs):
+    schedule_bump(REFERENCE_VERSION)
+
+
+@receiver(post_save, sender=Recipe)
+def create_recipe_image_variants(sender, instance, **kwargs):
+    schedule_variants(instance.image)
+
+
+@receiver(post_save, sender=User)
+def create_avatar_variants(sender, instance, **kwargs):
+    schedule_variants(instance.avatar)
+
+
+@receiver(post_save, sender=Recipe)
+def push_recipe_to_feeds(sender, instance, created, **kwargs):
+    if created:
+        recipe_id = instance.pk
+        transaction.on_commit(lambda: fan_out_recipe(recipe_id))
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_from_feeds(sender, instance, **kwargs):
+    author_id = instance.author_id
+    transaction.on_commit(lambda: invalidate_author_feeds([author_id]))
+
+
+@receiver((post_save, post_delete), sender=Subscription)
+def invalidate_subscriber_feed(sender, instance, **kwargs):
+    invalidate_timeline(instance.user_id)
+
+
+@receiver(post_save, sender=Recipe)
+def index_recipe_for_search(sender, instance, **kwargs):
+    schedule_index(instance.pk)
+
+
+@receiver(post_save, sender=Ingredient)
+def index_ingredient_recipes_for_search(sender, instance, created, **kwargs):
+    if created:
+        return
+    recipe_ids = AmountIngredient.objects.filter(
+        ingredient=instance
+    ).values_list('recipe_id', flat=True)
+    for recipe_id in recipe_ids:
+        schedule_index(recipe_id)
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_from_ingredient_index(sender, instance, **kwargs):
+    recipe_id = instance.pk
+    transaction.on_commit(lambda: recipe_ingredient_index.remove(recipe_id))
+
+
+@receiver(post_delete, sender=Ingredient)
+def invalidate_recipe_ingredient_index(sender, **kwargs):
+    recipe_ingredient_index.schedule_invalidate()
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def update_recipe_tag_index(sender, instance, action, reverse, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        recipe_tag_index.schedule_invalidate()
+        return
+    recipe_id = instance.pk
+    transaction.on_commit(lambda: recipe_tag_index.update(recipe_id))
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_from_tag_index(sender, instance, **kwargs):
+    recipe_id = instance.pk
+    transaction.on_commit(lambda: recipe_tag_index.remove(recipe_id))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_recipe_tag_index(sender, **kwargs):
+    recipe_tag_index.schedule_invalidate()
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShopingList)
+@receiver((post_save, post_delete), sender=Subscription)
+def invalidate_user_state(sender, instance, **kwargs):
+    schedule_bump(USER_STATE_VERSION.format(pk=instance.user_id))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe_responses(sender, instance, **kwargs):
+    schedule_bump(RECIPE_LIST_VERSION, RECIPE_VERSION.format(pk=instance.pk))
+
+
+@receiver((post_save, post_delete), sender=AmountIngredient)
+def invalidate_recipe_ingredient_responses(sender, instance, **kwargs):
+    schedule_bump(
+        RECIPE_LIST_VERSION, RECIPE_VERSION.format(pk=instance.recipe_id)
+    )
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tag_responses(sender, instance, action, reverse,
+                                    pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        recipe_ids = [instance.pk]
+    elif pk_set is not None:
+        recipe_ids = pk_set
+    else:
+        schedule_bump(RECIPE_LIST_VERSION, REFERENCE_VERSION)
+        return
+    schedule_bump(RECIPE_LIST_VERSION, *(
+        RECIPE_VERSION.format(pk=recipe_id) for recipe_id in recipe_ids
+    ))
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_responses(sender, instance, update_fields, **kwargs):
+    """
+    Профиль автора выводится в его рецептах. Пользователи без рецептов
+    и сохранение только времени входа кэш не затрагивают.
+    """
+    if not instance.recipes_count or (
+        update_fields and set(update_fields) <= {'last_login'}
+    ):
+        return
+    schedule_bump(RECIPE_LIST_VERSION, AUTHOR_VERSION.format(pk=instance.pk))
@@ -0,0 +1,94 @@
+from typing import Dict, FrozenSet, Iterable
+
+from django.conf import settings
+from django.core.cache import cache
+
+from api.cache import USER_STATE_VERSION, get_version
+from api.indexes import to_mask
+from recipes.models import Favorite, ShopingList, Subscription
+
+USER_STATE_KEY = 'user_state:{user_id}:{version}'
+
+
+class UserState:
+    """
+    Избранное, список покупок и подписки пользователя.
+
+    Позволяет отвечать на вопросы "в избранном ли рецепт" и "подписан ли
+    пользователь на автора" без запросов к базе данных.
+    """
+
+    def __init__(self, favorites: Iterable[int] = (),
+                 shopping_cart: Iterable[int] = (),
+                 following: Iterable[int] = ()) -> None:
+        self.favorites: FrozenSet[int] = frozenset(favorites)
+        self.shopping_cart: FrozenSet[int] = frozenset(shopping_cart)
+        self.following: FrozenSet[int] = frozenset(following)
+        self._masks: Dict[type, int] = {}
+
+    @classmethod
+    def load(cls, user_id: int) -> 'UserState':
+        return cls(
+            favorites=Favorite.objects.filter(
+                user_id=user_id
+            ).order_by().values_list('recipe_id', flat=True),
+            shopping_cart=ShopingList.objects.filter(
+                user_id=user_id
+            ).order_by().values_list('recipe_id', flat=True),
+            following=Subscription.objects.filter(
+                user_id=user_id
+            ).order_by().values_list('author_id', flat=True),
+        )
+
+    def recipe_ids(self, model) -> FrozenSet[int]:
+        """Id рецептов пользователя в избранном или списке покупок."""
+        if model is Favorite:
+            return self.favorites
+        if model is ShopingList:
+            return self.shopping_cart
+        raise ValueError(f'Неизвестная модель {model.__name__}')
+
+    def recipe_mask(self, model) -> int:
+        """Битовая маска рецептов из recipe_ids."""
+        if model not in self._masks:
+            self._masks[model] = to_mask(self.recipe_ids(model))
+        return self._masks[model]
+
+    def to_cache(self) -> Dict[str, list]:
+        return {
+            'favorites': list(self.favorites),
+            'shopping_cart': list(self.shopping_cart),
+            'following': list(self.following),
+        }
+
+
+EMPTY_STATE = UserState()
+
+
+def get_user_state(request) -> UserState:
+    """
+    Состояние пользователя запроса.
+
+    Загружается один раз за запрос: из кэша по текущей версии или из
+    базы данных тремя запросами. Версия увеличивается при изменении
+    избранного, списка покупок и подписок пользователя.
+    """
+    user = getattr(request, 'user', None)
+    if user is None or user.is_anonymous:
+        return EMPTY_STATE
+    http_request = getattr(request, '_request', request)
+    state = getattr(http_request, 'user_state', None)
+    if state is not None:
+        return state
+    key = USER_STATE_KEY.format(
+        user_id=user.pk,
+        version=get_version(USER_STATE_VERSION.format(pk=user.pk))
+    )
+    data = cache.get(key)
+    if data is None:
+        state = UserState.load(user.pk)
+        cache.set(key, state.to_cache(), settings.USER_STATE_TIMEOUT)
+    else:
+        state = UserState(**data)
+    http_request.user_state = state
+    return state
@@ -1,7 +1,8 @@
 from django.urls import include, path
 from rest_framework.routers import SimpleRouter
 
-from api.views import IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet
+from api.views import (IngredientViewSet, MetricsView, ProfileView,
+                       RecipeViewSet, TagViewSet, UserViewSet)
 
 router = SimpleRouter()
 
@@ -14,4 +15,8 @@ router.register('users', UserViewSet, basename='users')
 urlpatterns = [
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path(
+        'profiles/<str:profile_id>/', ProfileView.as_view(), name='profile'
+    ),
 ]
@@ -1,32 +1,47 @@
-from django.http import Http404
+from django.conf import settings
+from django.http import FileResponse, Http404
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
-from rest_framework.pagination import LimitOffsetPagination
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import (LimitOffsetPagination,
+                                       PageNumberPagination)
+from rest_framework.permissions import (AllowAny, IsAdminUser,
+                                        IsAuthenticated)
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from urlshortner.models import Url
 from urlshortner.utils import shorten_url
 
 from api import serializers
+from api.cache import (AUTHOR_VERSION, RECIPE_LIST_VERSION, RECIPE_VERSION,
+                       REFERENCE_VERSION)
+from api.feed import get_feed
 from api.filters import IngredientFilter, RecipeFilter, TagFilter
-from api.mixins import IngridientTagMixin
-from api.permissions import IsAuthorOrReadOnly
-from api.services import shopping_list_txt
-from recipes.models import (
-    Favorite, Ingredient, Recipe, ShopingList, Tag
-)
+from api.indexes import ingredient_index, recipe_ingredient_index
+from api.metrics import registry
+from api.mixins import (AnonymousCacheMixin, CursorPaginationMixin,
+                        IngridientTagMixin)
+from api.pagination import IdCursorPagination, RecipeCursorPagination
+from api.permissions import IsAuthorOrReadOnly, IsStaffOrMetricsToken
+from api.profiling import load_profile, profile_path
+from api.renderers import CSVRenderer, PlainTextRenderer
+from api.services import batch_add, batch_remove, shopping_list_response
+from recipes.models import (Favorite, Ingredient, Recipe, ShopingList,
+                            Subscription, Tag)
 from users.models import User
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(CursorPaginationMixin, viewsets.ModelViewSet):
     """Вьюсет для регистрации, получения и редактирования данных пользователя.
     """
 
     queryset = User.objects.all()
     permission_classes = (permissions.AllowAny,)
     pagination_class = LimitOffsetPagination
+    cursor_pagination_class = IdCursorPagination
 
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -66,6 +81,7 @@ class UserViewSet(viewsets.ModelViewSet):
                     'author': author,
                     'user': user,
                     'request': request,
+                    'recipes_limit': self.get_recipes_limit(),
                     'is_subscription_exist': is_subscription_exist}
             )
             serializer.is_valid(raise_exception=True)
@@ -88,14 +104,51 @@ class UserViewSet(viewsets.ModelViewSet):
     )
     def subscriptions(self, request):
         user = self.request.user
-        paginate_subs = self.paginate_queryset(user.subscriptions.all())
+        recipes_limit = self.get_recipes_limit()
+        paginate_subs = self.paginate_queryset(
+            user.subscriptions.with_recipes(recipes_limit)
+        )
         serializer = serializers.SubscribeSerializer(
             paginate_subs,
             many=True,
-            context={'request': request}
+            context={'request': request, 'recipes_limit': recipes_limit}
         )
         return self.get_paginated_response(serializer.data)
 
+    @action(
+        ['POST', 'DELETE'],
+        detail=False,
+        url_path='subscribe/batch',
+        url_name='subscribe_batch',
+        permission_classes=[IsAuthenticated, ],
+    )
+    def subscribe_batch(self, request):
+        """
+        Подписка на нескольких авторов или отписка от них.
+        """
+        serializer = serializers.BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        user = request.user
+        found_ids = set(User.objects.filter(
+            pk__in=ids
+        ).exclude(pk=user.pk).values_list('pk', flat=True))
+        batch = batch_add if request.method == 'POST' else batch_remove
+        results = batch(user, Subscription, 'author', ids, found_ids)
+        for result in results:
+            if result['id'] == user.pk:
+                result['status'] = 'forbidden'
+        return Response(results)
+
+    def get_recipes_limit(self):
+        """
+        Возвращает ограничение числа рецептов автора из параметров запроса.
+        """
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit and recipes_limit.isdigit() and int(recipes_limit):
+            return int(recipes_limit)
+        return None
+
     @action(
         ['POST'],
         detail=False,
@@ -175,23 +228,88 @@ class IngredientViewSet(IngridientTagMixin):
     serializer_class = serializers.IngredientSerializer
     filterset_class = IngredientFilter
 
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(self.search, *args, **kwargs)
+
+    def search(self, request, *args, **kwargs):
+        """
+        Поиск ингредиентов по индексу в памяти процесса, без запросов к БД.
+
+        Без параметра name возвращается весь список ингредиентов.
+        """
+        name = request.query_params.get('name', '')
+        return Response(ingredient_index.search(
+            name, limit=settings.INGREDIENT_SEARCH_LIMIT if name else None
+        ))
+
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+    AnonymousCacheMixin, CursorPaginationMixin, viewsets.ModelViewSet
+):
     """
     Вьюсет для создания, удаления, редактирования, получения рецептов.
+
+    Список и рецепт для анонимных пользователей отдаются из кэша.
     """
 
     queryset = Recipe.objects.all()
+    cursor_pagination_class = RecipeCursorPagination
+    cursor_bypass_params = ('search',)
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
     permission_classes = [IsAuthorOrReadOnly]
     http_method_names = ['get', 'post', 'patch', 'delete']
 
+    def get_queryset(self):
+        if self.request.method in permissions.SAFE_METHODS:
+            return super().get_queryset().with_related()
+        return super().get_queryset()
+
     def get_serializer_class(self):
         if self.request.method in permissions.SAFE_METHODS:
             return serializers.RecipeGetSerializer
         return serializers.RecipeSerializer
 
+    def list(self, request, *args, **kwargs):
+        """
+        Список рецептов.
+
+        С параметром facets=1 в ответ добавляется число рецептов
+        по каждому тегу с учетом остальных фильтров.
+        """
+        return self.get_anonymous_response(
+            self.filtered_list, *args, **kwargs
+        )
+
+    def filtered_list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        facets = request.query_params.get('facets') in ('1', 'true')
+        if facets and isinstance(response.data, dict):
+            filterset = DjangoFilterBackend().get_filterset(
+                request, self.get_queryset(), self
+            )
+            response.data['facets'] = filterset.tag_facets()
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_anonymous_response(
+            super().retrieve, *args, **kwargs
+        )
+
+    def get_cache_dependencies(self):
+        if self.action != 'retrieve':
+            return [REFERENCE_VERSION, RECIPE_LIST_VERSION]
+        pk = self.kwargs['pk']
+        return [
+            REFERENCE_VERSION,
+            RECIPE_VERSION.format(pk=int(pk) if pk.isdigit() else pk)
+        ]
+
+    def get_response_dependencies(self, data):
+        if self.action != 'retrieve':
+            return []
+        return [AUTHOR_VERSION.format(pk=data['author']['id'])]
+
     @action(
         ['POST', 'DELETE'],
         detail=True,
@@ -212,6 +330,42 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return self.add_recipe(request, Favorite, pk, 'FAVORITE')
         return self.delete_recipe(request, Favorite, pk, 'FAVORITE')
 
+    @action(
+        ['POST', 'DELETE'],
+        detail=False,
+        url_path='shopping_cart/batch',
+        url_name='shopping_cart_batch',
+        permission_classes=[IsAuthenticated, ],
+    )
+    def shopping_cart_batch(self, request):
+        return self.batch_recipes(request, ShopingList)
+
+    @action(
+        ['POST', 'DELETE'],
+        detail=False,
+        url_path='favorite/batch',
+        url_name='favorite_batch',
+        permission_classes=[IsAuthenticated, ],
+    )
+    def favorite_batch(self, request):
+        return self.batch_recipes(request, Favorite)
+
+    def batch_recipes(self, request, model):
+        """
+        Добавление или удаление нескольких рецептов одним запросом.
+
+        Возвращает результат по каждому id: added, exists, removed,
+        missing или not_found.
+        """
+        serializer = serializers.BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        found_ids = set(
+            Recipe.objects.filter(pk__in=ids).values_list('pk', flat=True)
+        )
+        batch = batch_add if request.method == 'POST' else batch_remove
+        return Response(batch(request.user, model, 'recipe', ids, found_ids))
+
     def add_recipe(self, request, model, pk, error_key):
         recipe = get_object_or_404(Recipe, pk=pk)
         user = self.request.user
@@ -241,14 +395,101 @@ class RecipeViewSet(viewsets.ModelViewSet):
         ['GET'],
         detail=False,
         permission_classes=[IsAuthenticated, ],
+        renderer_classes=[PlainTextRenderer, CSVRenderer, JSONRenderer],
     )
     def download_shopping_cart(self, request):
+        """
+        Скачивание списка покупок.
+
+        Формат файла выбирается параметром format: txt, csv или json.
+        """
         if not request.user.shoping_list.exists():
             return Response(
                 'Список покупок пуст.',
                 status=status.HTTP_404_NOT_FOUND
             )
-        return shopping_list_txt(user=request.user)
+        return shopping_list_response(
+            user=request.user, file_format=request.accepted_renderer.format
+        )
+
+    @action(
+        ['GET'],
+        detail=False,
+        permission_classes=[IsAuthenticated, ],
+        pagination_class=PageNumberPagination,
+        cursor_pagination_class=None,
+    )
+    def feed(self, request):
+        """
+        Лента рецептов авторов, на которых подписан пользователь.
+        """
+        page_ids = self.paginate_queryset(get_feed(request.user))
+        recipes = self.get_queryset().in_bulk(page_ids)
+        serializer = serializers.RecipeGetSerializer(
+            [recipes[pk] for pk in page_ids if pk in recipes],
+            many=True,
+            context={'request': request}
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        ['GET'],
+        detail=False,
+        permission_classes=[AllowAny, ],
+        pagination_class=PageNumberPagination,
+        cursor_pagination_class=None,
+    )
+    def match(self, request):
+        """
+        Подбор рецептов по имеющимся ингредиентам.
+
+        ingredients — id имеющихся ингредиентов, missing — сколько
+        ингредиентов может не хватать, include и exclude — ингредиенты,
+        которые обязательно должны быть или отсутствовать в рецепте.
+        """
+        available = self.get_id_list('ingredients')
+        if not available:
+            raise ValidationError({'ingredients': 'Укажите ингредиенты'})
+        missing = request.query_params.get('missing', '0')
+        if not missing.isdigit():
+            raise ValidationError(
+                {'missing': 'Укажите неотрицательное целое число'}
+            )
+        matches = recipe_ingredient_index.match(
+            available,
+            max_missing=int(missing),
+            include=self.get_id_list('include'),
+            exclude=self.get_id_list('exclude'),
+        )
+        page = self.paginate_queryset(matches)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in page]
+        )
+        results = []
+        for recipe_id, missing_count, coverage in page:
+            recipe = recipes.get(recipe_id)
+            if recipe is not None:
+                recipe.missing_ingredients = missing_count
+                recipe.coverage = round(coverage, 4)
+                results.append(recipe)
+        serializer = serializers.RecipeMatchSerializer(
+            results, many=True, context={'request': request}
+        )
+        return self.get_paginated_response(serializer.data)
+
+    def get_id_list(self, name):
+        """
+        Возвращает список id из параметра запроса.
+
+        Id можно передать через запятую или повторяя параметр.
+        """
+        ids = set()
+        for value in self.request.query_params.getlist(name):
+            for pk in filter(None, value.split(',')):
+                if not pk.strip().isdigit():
+                    raise ValidationError({name: f'Неверный id: {pk}'})
+                ids.add(int(pk))
+        return ids
 
     @action(
         ['GET'],
@@ -273,3 +514,42 @@ class RecipeViewSet(viewsets.ModelViewSet):
             url_route_to_recipe, is_permanent=False)
         final_short_link = f'{main_domain}/s/{url_route_to_recipe}'
         return Response({'short-link': final_short_link})
+
+
+class MetricsView(APIView):
+    """
+    Метрики запросов всех процессов в текстовом формате Prometheus.
+
+    Доступно персоналу или по токену METRICS_TOKEN.
+    """
+
+    permission_classes = (IsStaffOrMetricsToken,)
+    renderer_classes = (PlainTextRenderer,)
+
+    def get(self, request):
+        return Response(
+            registry.render(),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
+
+
+class ProfileView(APIView):
+    """
+    Профиль запроса, снятый ProfilingMiddleware.
+
+    Возвращает сводку в JSON, с параметром download=1 — дамп pstats.
+    Доступно только персоналу.
+    """
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, profile_id):
+        summary = load_profile(profile_id)
+        if summary is None:
+            raise Http404
+        if request.query_params.get('download'):
+            return FileResponse(
+                open(profile_path(profile_id, 'prof'), 'rb'),
+                as_attachment=True, filename=f'{profile_id}.prof'
+            )
+        return Response(summary)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 import os
+import tempfile
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -47,6 +48,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.InstrumentationMiddleware',
+    'api.profiling.ProfilingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -75,17 +78,49 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
 
-DATABASES = {
+if os.getenv('DB_ENGINE', 'postgresql') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB', 'django_db'),
+            'USER': os.getenv('POSTGRES_USER', 'django'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', 'password'),
+            'HOST': os.getenv('DB_HOST', ''),
+            'PORT': os.getenv('DB_PORT', 5432)
+        }
+    }
+
+# Версии данных, блокировки и ленты должны быть общими для всех процессов
+# gunicorn, поэтому вне отладки по умолчанию используется memcached.
+# Кэши LocMemCache и FileBasedCache допустимы только с одним процессом.
+if DEBUG:
+    DEFAULT_CACHE_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
+    DEFAULT_CACHE_LOCATION = 'foodgram'
+else:
+    DEFAULT_CACHE_BACKEND = (
+        'django.core.cache.backends.memcached.PyMemcacheCache'
+    )
+    DEFAULT_CACHE_LOCATION = 'memcached:11211'
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': os.getenv('POSTGRES_DB', 'django_db'),
-        'USER': os.getenv('POSTGRES_USER', 'django'),
-        'PASSWORD': os.getenv('POSTGRES_PASSWORD', 'password'),
-        'HOST': os.getenv('DB_HOST', ''),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'BACKEND': os.getenv('CACHE_BACKEND', DEFAULT_CACHE_BACKEND),
+        'LOCATION': os.getenv('CACHE_LOCATION', DEFAULT_CACHE_LOCATION),
     }
 }
 
+PROCESS_LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.filebased.FileBasedCache',
+)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -120,6 +155,63 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 6,
 }
 
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 50))
+
+REFERENCE_CACHE_TIMEOUT = int(os.getenv('REFERENCE_CACHE_TIMEOUT', 86400))
+
+REFERENCE_CACHE_MAX_AGE = int(os.getenv('REFERENCE_CACHE_MAX_AGE', 60))
+
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 300))
+RESPONSE_CACHE_STALE_TIMEOUT = int(
+    os.getenv('RESPONSE_CACHE_STALE_TIMEOUT', 24 * 60 * 60)
+)
+RESPONSE_CACHE_LOCK_TIMEOUT = int(os.getenv('RESPONSE_CACHE_LOCK_TIMEOUT', 30))
+RESPONSE_CACHE_LOCK_WAIT = float(os.getenv('RESPONSE_CACHE_LOCK_WAIT', 2))
+
+ESTIMATED_COUNT_THRESHOLD = int(os.getenv('ESTIMATED_COUNT_THRESHOLD', 10000))
+
+FEED_LENGTH = int(os.getenv('FEED_LENGTH', 500))
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 1000))
+FEED_TIMEOUT = int(os.getenv('FEED_TIMEOUT', 24 * 60 * 60))
+FEED_LOCK_TIMEOUT = int(os.getenv('FEED_LOCK_TIMEOUT', 30))
+FEED_LOCK_WAIT = float(os.getenv('FEED_LOCK_WAIT', 2))
+
+BITMAP_IN_LIMIT = int(os.getenv('BITMAP_IN_LIMIT', 1000))
+BITMAP_SCAN_CHUNK = int(os.getenv('BITMAP_SCAN_CHUNK', 1000))
+
+USER_STATE_TIMEOUT = int(os.getenv('USER_STATE_TIMEOUT', 24 * 60 * 60))
+
+BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', 100))
+
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'False').lower() == 'true'
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', 500))
+SLOW_REQUEST_QUERIES = int(os.getenv('SLOW_REQUEST_QUERIES', 50))
+SLOW_REQUEST_TOP_QUERIES = int(os.getenv('SLOW_REQUEST_TOP_QUERIES', 5))
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True').lower() == 'true'
+METRICS_DIR = os.getenv(
+    'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'foodgram_metrics')
+)
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 1))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+PROFILE_DIR = os.getenv(
+    'PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'foodgram_profiles')
+)
+PROFILE_TOP = int(os.getenv('PROFILE_TOP', 30))
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', 100))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
 DJOSER = {
     'USER_ID_FIELD': 'email',
     'LOGIN_FIELD': 'email',
@@ -147,4 +239,16 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+IMAGE_VARIANTS = {
+    'thumbnail': {'size': (480, 480), 'format': 'JPEG'},
+    'thumbnail_webp': {'size': (480, 480), 'format': 'WEBP'},
+    'webp': {'size': None, 'format': 'WEBP'},
+}
+MAX_IMAGE_UPLOAD_SIZE = int(os.getenv('MAX_IMAGE_UPLOAD_SIZE', 5 * 1024 * 1024))
+MAX_IMAGE_DIMENSION = int(os.getenv('MAX_IMAGE_DIMENSION', 6000))
+MAX_IMAGE_PIXELS = int(os.getenv('MAX_IMAGE_PIXELS', 24_000_000))
+IMAGE_SPOOL_SIZE = int(os.getenv('IMAGE_SPOOL_SIZE', 1024 * 1024))
+IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', 80))
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
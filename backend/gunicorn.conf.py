@@ -0,0 +1,15 @@
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+
+
+def child_exit(server, worker):
+    """Переносит метрики завершившегося процесса в архивный файл."""
+    from api.metrics import registry
+
+    try:
+        registry.mark_process_dead(worker.pid)
+    except OSError as e:
+        server.log.warning(
+            'Не удалось перенести метрики %s: %s', worker.pid, e
+        )
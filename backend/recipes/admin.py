@@ -1,6 +1,9 @@
 from django.contrib import admin
+from django.db.models import Exists, OuterRef, Q
+from django.utils.text import smart_split, unescape_string_literal
 
-from recipes.models import Favorite, Ingredient, Recipe, Tag
+from api.pagination import EstimatedCountPaginator
+from recipes.models import AmountIngredient, Ingredient, Recipe, Tag
 
 
 @admin.register(Tag)
@@ -21,6 +24,8 @@ class IngredientAdmin(admin.ModelAdmin):
     )
     search_fields = ('name', 'measurement_unit',)
     list_filter = ('measurement_unit',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(Recipe)
@@ -34,11 +39,34 @@ class RecipeAdmin(admin.ModelAdmin):
     search_fields = ('name', 'author__username', 'ingredients__name')
     list_filter = ('tags', 'pub_date',)
     list_editable = ('name',)
+    list_select_related = ('author',)
     filter_horizontal = ('tags', 'ingredients')
     readonly_fields = ('in_favorites',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Поиск по названию, автору и ингредиентам рецепта.
+
+        Ингредиенты ищутся подзапросом EXISTS, а не через JOIN,
+        поэтому строки рецептов не размножаются и DISTINCT не нужен.
+        """
+        for bit in smart_split(search_term):
+            if bit.startswith(('"', "'")) and bit[0] == bit[-1]:
+                bit = unescape_string_literal(bit)
+            queryset = queryset.filter(
+                Q(name__icontains=bit)
+                | Q(author__username__icontains=bit)
+                | Q(Exists(AmountIngredient.objects.filter(
+                    recipe=OuterRef('pk'), ingredient__name__icontains=bit
+                )))
+            )
+        return queryset, False
+
+    @admin.display(description='В избранном', ordering='favorites_count')
     def in_favorites(self, obj):
-        return Favorite.objects.filter(recipe=obj).count()
+        return obj.favorites_count
 
 
 admin.site.empty_value_display = 'Не задано'
@@ -0,0 +1,60 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import Favorite, Recipe, ShopingList, Subscription
+from users.models import User
+
+# Счетчик: модель, поле счетчика, считаемая модель и ее внешний ключ.
+COUNTERS = (
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'subscribers_count', Subscription, 'author'),
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'shopping_cart_count', ShopingList, 'recipe'),
+)
+
+
+def change_counter(model, field: str, pks, delta: int) -> None:
+    """
+    Атомарно изменяет счетчик у объектов на delta.
+
+    Изменение выполняется F-выражением на стороне базы данных,
+    поэтому параллельные запросы не теряют обновлений.
+    """
+    model.objects.filter(pk__in=pks).update(
+        **{field: Greatest(F(field) + delta, 0)}
+    )
+
+
+def actual_count(counted_model, foreign_key: str):
+    """
+    Подзапрос, который считает связанные объекты для строки счетчика.
+    """
+    return Coalesce(
+        Subquery(
+            counted_model.objects.filter(
+                **{foreign_key: OuterRef('pk')}
+            ).order_by().values(foreign_key).annotate(
+                count=Count('pk')
+            ).values('count')
+        ),
+        0
+    )
+
+
+def recount_counters() -> dict:
+    """
+    Исправляет расхождения счетчиков с фактическим числом объектов.
+
+    Обновляются только строки, в которых счетчик разошелся с данными.
+    Возвращает число исправленных строк по каждому счетчику.
+    """
+    fixed = {}
+    for model, field, counted_model, foreign_key in COUNTERS:
+        count = actual_count(counted_model, foreign_key)
+        drifted = model.objects.annotate(actual=count).exclude(
+            **{field: F('actual')}
+        )
+        fixed[f'{model.__name__}.{field}'] = model.objects.filter(
+            pk__in=drifted.values('pk')
+        ).update(**{field: count})
+    return fixed
@@ -0,0 +1,42 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+
+from recipes.transfer import export_media, export_records
+
+
+class Command(BaseCommand):
+    """
+    Выгрузка рецептов в JSON Lines: одна строка на рецепт.
+
+    Теги, ингредиенты и автор записываются натуральными ключами,
+    изображение - именем файла в хранилище.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='Файл для выгрузки, по умолчанию стандартный вывод'
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--media', help='Каталог, куда скопировать изображения рецептов'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file = sys.stdout if path == '-' else open(path, 'w', encoding='utf8')
+        exported = 0
+        try:
+            for record in export_records(options['batch_size']):
+                file.write(json.dumps(record, ensure_ascii=False) + '\n')
+                if options['media']:
+                    export_media(record['image'], options['media'])
+                exported += 1
+        finally:
+            if file is not sys.stdout:
+                file.close()
+        self.stderr.write(
+            self.style.SUCCESS(f'Выгружено рецептов: {exported}')
+        )
@@ -0,0 +1,213 @@
+import io
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from PIL import Image
+
+from api.cache import RECIPE_LIST_VERSION, REFERENCE_VERSION, bump_version
+from api.indexes import (ingredient_index, recipe_ingredient_index,
+                         recipe_tag_index)
+from api.search import index_recipe
+from recipes.counters import recount_counters
+from recipes.models import (Favorite, Ingredient, ShopingList, Subscription,
+                            Tag)
+from recipes.reference import batches
+from recipes.transfer import import_batch
+from users.models import User
+
+USERNAME = 'bench_user_{}'
+PASSWORD = 'bench-password'
+IMAGE_NAME = 'recipes/images/bench.png'
+UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.', 'ч. л.', 'по вкусу')
+WORDS = (
+    'суп', 'салат', 'пирог', 'каша', 'рагу', 'запеканка', 'котлеты',
+    'блины', 'омлет', 'паста', 'соус', 'борщ', 'плов', 'жаркое', 'десерт',
+    'куриный', 'овощной', 'грибной', 'сырный', 'томатный', 'домашний',
+    'быстрый', 'летний', 'острый', 'сладкий', 'легкий', 'праздничный',
+)
+
+
+class Command(BaseCommand):
+    """
+    Генерация синтетических данных для нагрузочного тестирования.
+
+    При одинаковом --seed создаются одинаковые данные. Пользователи
+    получают имена bench_user_N и пароль bench-password.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--ingredients', type=int, default=500)
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Избранных рецептов на пользователя'
+        )
+        parser.add_argument(
+            '--carts', type=int, default=5,
+            help='Рецептов в списке покупок на пользователя'
+        )
+        parser.add_argument(
+            '--subscriptions', type=int, default=10,
+            help='Подписок на пользователя'
+        )
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username=USERNAME.format(0)).exists():
+            raise CommandError('Синтетические данные уже созданы')
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.monotonic()
+        users = self.create_users(options['users'])
+        ingredients = self.create_ingredients(options['ingredients'])
+        tags = self.create_tags(options['tags'])
+        recipes = self.create_recipes(
+            options['recipes'], users, ingredients, tags
+        )
+        for model, per_user in (
+            (Favorite, options['favorites']),
+            (ShopingList, options['carts']),
+        ):
+            self.create_links(
+                model, 'recipe_id', users, recipes, per_user
+            )
+        self.create_links(
+            Subscription, 'author_id', users, users,
+            options['subscriptions'], exclude_self=True
+        )
+        self.log('Пересчет счетчиков')
+        recount_counters()
+        self.log('Построение поискового индекса')
+        for recipe_id in recipes:
+            index_recipe(recipe_id)
+        ingredient_index.invalidate()
+        recipe_ingredient_index.invalidate()
+        recipe_tag_index.invalidate()
+        bump_version(REFERENCE_VERSION)
+        bump_version(RECIPE_LIST_VERSION)
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные созданы за {time.monotonic() - started:.1f} с'
+        ))
+
+    def log(self, message):
+        self.stdout.write(f'  {message}')
+
+    def create_users(self, count):
+        self.log(f'Пользователи: {count}')
+        password = make_password(PASSWORD)
+        for batch in batches(range(count), self.batch_size):
+            User.objects.bulk_create(
+                User(
+                    username=USERNAME.format(number),
+                    email=f'{USERNAME.format(number)}@example.com',
+                    first_name=f'Имя{number}',
+                    last_name=f'Фамилия{number}',
+                    password=password,
+                )
+                for number in batch
+            )
+        return list(User.objects.filter(
+            username__startswith=USERNAME.format('')
+        ).order_by('pk').values_list('pk', flat=True))
+
+    def create_ingredients(self, count):
+        self.log(f'Ингредиенты: {count}')
+        for batch in batches(range(count), self.batch_size):
+            Ingredient.objects.bulk_create(
+                (
+                    Ingredient(
+                        name=f'ингредиент {number}',
+                        measurement_unit=self.random.choice(UNITS)
+                    )
+                    for number in batch
+                ),
+                ignore_conflicts=True
+            )
+        return list(Ingredient.objects.order_by('pk').values_list(
+            'name', 'measurement_unit'
+        ))
+
+    def create_tags(self, count):
+        self.log(f'Теги: {count}')
+        Tag.objects.bulk_create(
+            (
+                Tag(name=f'Тег {number}', slug=f'bench-tag-{number}')
+                for number in range(count)
+            ),
+            ignore_conflicts=True
+        )
+        return list(Tag.objects.order_by('pk').values_list('slug', flat=True))
+
+    def create_recipes(self, count, users, ingredients, tags):
+        self.log(f'Рецепты: {count}')
+        if not default_storage.exists(IMAGE_NAME):
+            image = io.BytesIO()
+            Image.new('RGB', (64, 64), (200, 120, 40)).save(image, 'PNG')
+            default_storage.save(IMAGE_NAME, ContentFile(image.getvalue()))
+        authors = dict(User.objects.filter(pk__in=users).values_list(
+            'pk', 'username'
+        ))
+        now = timezone.now()
+        recipe_ids = []
+        for batch in batches(range(count), self.batch_size):
+            records = []
+            for number in batch:
+                words = self.random.sample(WORDS, 3)
+                records.append({
+                    'author': authors[self.random.choice(users)],
+                    'name': f'{" ".join(words).capitalize()} {number}',
+                    'text': ' '.join(self.random.choices(WORDS, k=30)),
+                    'cooking_time': self.random.randint(5, 180),
+                    'pub_date': (now - timedelta(
+                        minutes=self.random.randint(0, 365 * 24 * 60)
+                    )).isoformat(),
+                    'image': IMAGE_NAME,
+                    'tags': self.random.sample(
+                        tags, min(len(tags), self.random.randint(1, 3))
+                    ),
+                    'ingredients': [
+                        {
+                            'name': name,
+                            'measurement_unit': measurement_unit,
+                            'amount': self.random.randint(1, 500),
+                        }
+                        for name, measurement_unit in self.random.sample(
+                            ingredients,
+                            min(len(ingredients), self.random.randint(3, 12))
+                        )
+                    ],
+                })
+            result = import_batch(records)
+            recipe_ids.extend(recipe.pk for recipe in result['recipes'])
+        return recipe_ids
+
+    def create_links(self, model, field, users, targets, per_user,
+                     exclude_self=False):
+        self.log(f'{model._meta.verbose_name_plural}: {per_user} на '
+                 f'пользователя')
+        for batch in batches(
+            self.iter_links(model, field, users, targets, per_user,
+                            exclude_self),
+            self.batch_size
+        ):
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+
+    def iter_links(self, model, field, users, targets, per_user,
+                   exclude_self):
+        for user_id in users:
+            sample = self.random.sample(
+                targets, min(len(targets), per_user + 1)
+            )
+            if exclude_self:
+                sample = [target for target in sample if target != user_id]
+            for target in sample[:per_user]:
+                yield model(user_id=user_id, **{field: target})
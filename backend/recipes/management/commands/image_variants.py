@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from api.images import generate_variants
+from recipes.models import Recipe
+from users.models import User
+
+
+class Command(BaseCommand):
+    """
+    Создание миниатюр и WebP-версий для уже загруженных изображений.
+
+    Обрабатываются только изображения, варианты которых еще не отмечены
+    как готовые.
+    """
+
+    def handle(self, *args, **options):
+        names = Recipe.objects.exclude(
+            image_variants_for=F('image')
+        ).values_list('image', flat=True).iterator()
+        avatars = User.objects.exclude(avatar='').exclude(
+            avatar__isnull=True
+        ).exclude(
+            avatar_variants_for=F('avatar')
+        ).values_list('avatar', flat=True).iterator()
+        processed = 0
+        for queryset in (names, avatars):
+            for name in queryset:
+                try:
+                    generate_variants(name)
+                except Exception as e:
+                    self.stderr.write(self.style.ERROR(f'{name}: {e}'))
+                    continue
+                processed += 1
+        self.stdout.write(
+            self.style.SUCCESS(f'Обработано изображений: {processed}')
+        )
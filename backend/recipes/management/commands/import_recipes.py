@@ -0,0 +1,118 @@
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+
+from api.cache import RECIPE_LIST_VERSION, bump_version
+from api.feed import invalidate_author_feeds
+from api.indexes import recipe_ingredient_index, recipe_tag_index
+from api.search import index_recipe
+from recipes.counters import change_counter
+from recipes.reference import batches, read_json
+from recipes.transfer import import_batch
+from users.models import User
+
+
+def load_batch(records, media_dir):
+    """
+    Загружает пачку рецептов и обновляет то, что обычно делают сигналы:
+    счетчики рецептов авторов и поисковый индекс.
+    """
+    try:
+        result = import_batch(records, media_dir)
+        authors = Counter(recipe.author_id for recipe in result['recipes'])
+        by_delta = {}
+        for author_id, count in authors.items():
+            by_delta.setdefault(count, []).append(author_id)
+        for count, author_ids in by_delta.items():
+            change_counter(User, 'recipes_count', author_ids, count)
+        for recipe in result['recipes']:
+            index_recipe(recipe.pk)
+        result['authors'] = set(authors)
+        return result
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    """
+    Загрузка рецептов из JSON Lines, созданного командой export_recipes.
+
+    Файл читается потоково и загружается пачками; в памяти одновременно
+    находится не больше двух пачек на каждый поток.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл JSON Lines с рецептами')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Число потоков, загружающих пачки параллельно'
+        )
+        parser.add_argument(
+            '--media', help='Каталог с изображениями из export_recipes'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['workers'] < 1:
+            raise CommandError(
+                'Размер пакета и число потоков должны быть больше нуля'
+            )
+        workers = options['workers']
+        total = created = skipped = 0
+        authors = set()
+        started = time.monotonic()
+
+        def collect(future):
+            nonlocal total, created, skipped
+            size = futures.pop(future)
+            total += size
+            try:
+                result = future.result()
+            except DatabaseError as e:
+                self.stderr.write(self.style.ERROR(
+                    f'Пачка из {size} рецептов не загружена: {e}'
+                ))
+                return
+            created += len(result['recipes'])
+            skipped += result['skipped']
+            authors.update(result['authors'])
+            for error in result['errors']:
+                self.stderr.write(self.style.ERROR(error))
+            elapsed = max(time.monotonic() - started, 0.001)
+            self.stdout.write(
+                f'  обработано {total} рецептов, {total / elapsed:.0f} в с'
+            )
+
+        futures = {}
+        try:
+            with open(options['path'], encoding='utf8') as file, (
+                ThreadPoolExecutor(max_workers=workers)
+            ) as executor:
+                for batch in batches(read_json(file), options['batch_size']):
+                    if len(futures) >= workers * 2:
+                        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            collect(future)
+                    future = executor.submit(
+                        load_batch, batch, options['media']
+                    )
+                    futures[future] = len(batch)
+                for future in list(futures):
+                    collect(future)
+        except FileNotFoundError:
+            raise CommandError(f'Файл {options["path"]} не найден')
+        except ValueError as e:
+            raise CommandError(f'Ошибка в файле {options["path"]}: {e}')
+        finally:
+            if created:
+                recipe_ingredient_index.invalidate()
+                recipe_tag_index.invalidate()
+                invalidate_author_feeds(authors)
+                bump_version(RECIPE_LIST_VERSION)
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено рецептов: {created}, уже были: {skipped}, '
+            f'с ошибками: {total - created - skipped}'
+        ))
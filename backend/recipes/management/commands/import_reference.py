@@ -0,0 +1,83 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.cache import REFERENCE_VERSION, bump_version
+from api.indexes import ingredient_index, recipe_tag_index
+from recipes.reference import (REFERENCE_MODELS, batches, copy_batch,
+                               read_rows, upsert_batch)
+
+DEFAULT_FILES = {
+    'ingredients': ['data/ingredients.csv'],
+    'tags': [],
+}
+
+
+class Command(BaseCommand):
+    """
+    Импорт справочников ингредиентов и тегов из CSV, JSON или JSON Lines.
+
+    Повторный запуск не создает дублей: строки с уже существующим
+    ключом обновляются или пропускаются.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help='Файлы для загрузки')
+        parser.add_argument(
+            '--model', choices=sorted(REFERENCE_MODELS),
+            default='ingredients', help='Загружаемый справочник'
+        )
+        parser.add_argument(
+            '--format', choices=('csv', 'json'), dest='file_format',
+            help='Формат файлов, по умолчанию определяется по расширению'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='Не использовать COPY даже на PostgreSQL'
+        )
+
+    def handle(self, *args, **options):
+        model, fields, unique = REFERENCE_MODELS[options['model']]
+        paths = options['paths'] or DEFAULT_FILES[options['model']]
+        if not paths:
+            raise CommandError('Укажите файлы для загрузки')
+        if options['batch_size'] < 1:
+            raise CommandError('Размер пакета должен быть больше нуля')
+        load_batch = upsert_batch
+        if connection.vendor == 'postgresql' and not options['no_copy']:
+            load_batch = copy_batch
+        total = created = updated = 0
+        started = time.monotonic()
+        for path in paths:
+            self.stdout.write(f'Началась загрузка файла {path}')
+            try:
+                rows = read_rows(path, fields, options['file_format'])
+                for batch in batches(rows, options['batch_size']):
+                    batch_created, batch_updated = load_batch(
+                        model, fields, unique, batch
+                    )
+                    total += len(batch)
+                    created += batch_created
+                    updated += batch_updated
+                    elapsed = time.monotonic() - started
+                    self.stdout.write(
+                        f'  обработано {total} строк, '
+                        f'{total / max(elapsed, 0.001):.0f} строк/с'
+                    )
+            except FileNotFoundError:
+                raise CommandError(f'Файл {path} не найден')
+            except (KeyError, ValueError) as e:
+                raise CommandError(f'Ошибка в файле {path}: {e}')
+        if options['model'] == 'ingredients':
+            ingredient_index.invalidate()
+        else:
+            recipe_tag_index.invalidate()
+        bump_version(REFERENCE_VERSION)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено строк: {total}, добавлено: {created}, '
+            f'обновлено: {updated}, пропущено: '
+            f'{total - created - updated}, время: {elapsed:.1f} с'
+        ))
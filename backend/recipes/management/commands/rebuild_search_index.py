@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from api.search import index_recipe
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """Перестроение поискового индекса рецептов."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--missing', action='store_true',
+            help='Индексировать только рецепты без записей в индексе'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.all()
+        if options['missing']:
+            recipes = recipes.filter(search_terms__isnull=True)
+        indexed = 0
+        for recipe_id in recipes.values_list('pk', flat=True).iterator():
+            index_recipe(recipe_id)
+            indexed += 1
+        self.stdout.write(
+            self.style.SUCCESS(f'Проиндексировано рецептов: {indexed}')
+        )
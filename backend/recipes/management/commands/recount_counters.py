@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from recipes.counters import recount_counters
+
+
+class Command(BaseCommand):
+    """Сверка счетчиков рецептов, избранного, покупок и подписчиков."""
+
+    def handle(self, *args, **options):
+        for counter, fixed in recount_counters().items():
+            self.stdout.write(f'{counter}: исправлено строк - {fixed}')
+        self.stdout.write(self.style.SUCCESS('Счетчики сверены'))
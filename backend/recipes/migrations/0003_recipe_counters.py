@@ -0,0 +1,47 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    counters = (
+        (User, 'recipes_count', Recipe, 'author'),
+        (User, 'subscribers_count', apps.get_model('recipes', 'Subscription'), 'author'),
+        (Recipe, 'favorites_count', apps.get_model('recipes', 'Favorite'), 'recipe'),
+        (Recipe, 'shopping_cart_count', apps.get_model('recipes', 'ShopingList'), 'recipe'),
+    )
+    for model, field, counted_model, foreign_key in counters:
+        model.objects.update(**{field: Coalesce(
+            Subquery(
+                counted_model.objects.filter(
+                    **{foreign_key: OuterRef('pk')}
+                ).order_by().values(foreign_key).annotate(
+                    count=Count('pk')
+                ).values('count')
+            ),
+            0
+        )})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_initial'),
+        ('users', '0002_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,10 @@
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models import OuterRef, Prefetch, Subquery
 
 from api.constants import (ING_NAME_LENGHT, MAX_STR_VALUE, MAX_VALUE,
                            MEAS_NAME_LENGHT, MIN_VALUE, RECIPE_NAME_LENGHT,
-                           TAG_NAME_LENGHT)
+                           SEARCH_TERM_LENGHT, TAG_NAME_LENGHT)
 from users.models import User
 
 
@@ -50,6 +51,29 @@ class Ingredient(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    """
+    Выборка рецептов для чтения.
+
+    Загружает страницу рецептов фиксированным числом запросов.
+    """
+
+    def with_related(self):
+        """
+        Подгружает автора, тэги и ингредиенты рецептов.
+
+        Признаки избранного, списка покупок и подписки берутся
+        из состояния пользователя (api.state), а не из запроса к БД.
+        """
+        return self.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'recipe_ingredients',
+                queryset=AmountIngredient.objects.select_related('ingredient')
+            )
+        )
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
@@ -66,6 +90,12 @@ class Recipe(models.Model):
         upload_to="recipes/images/",
         verbose_name='Изображение'
     )
+    image_variants_for = models.CharField(
+        max_length=100,
+        blank=True,
+        editable=False,
+        verbose_name='Изображение с готовыми вариантами'
+    )
     ingredients = models.ManyToManyField(
         Ingredient, through='AmountIngredient',
         verbose_name='Ингредиенты'
@@ -85,12 +115,31 @@ class Recipe(models.Model):
         verbose_name='Дата публикации',
         auto_now_add=True
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном'
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок'
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'рецепты'
         ordering = ('-pub_date',)
         default_related_name = 'recipe'
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'], name='recipe_feed_idx'),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx'
+            ),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['name', 'author'],
@@ -135,6 +184,38 @@ class AmountIngredient(models.Model):
         return f'{self.ingredient} {self.amount}'
 
 
+class SubscriptionQuerySet(models.QuerySet):
+    """
+    Выборка подписок вместе с рецептами авторов.
+    """
+
+    def with_recipes(self, recipes_limit=None):
+        """
+        Подгружает авторов и их последние рецепты.
+
+        Ограничение recipes_limit применяется в базе данных: рецепты
+        всех авторов страницы загружаются одним запросом, в котором
+        для каждого автора отбираются только N последних рецептов.
+        Подзапрос по автору читает индекс recipe_author_pub_date_idx.
+        """
+        recipes = Recipe.objects.all()
+        if recipes_limit:
+            recipes = recipes.filter(
+                pk__in=Subquery(
+                    Recipe.objects.filter(
+                        author=OuterRef('author')
+                    ).order_by('-pub_date', '-pk').values('pk')[
+                        :recipes_limit
+                    ]
+                )
+            )
+        return self.select_related('author').prefetch_related(
+            Prefetch(
+                'author__recipe', queryset=recipes, to_attr='limited_recipes'
+            )
+        )
+
+
 class Subscription(models.Model):
     user = models.ForeignKey(
         User,
@@ -147,6 +228,8 @@ class Subscription(models.Model):
         on_delete=models.CASCADE
     )
 
+    objects = SubscriptionQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'подписки'
@@ -209,3 +292,32 @@ class ShopingList(models.Model):
 
     def __str__(self):
         return f'{self.recipe}'[:MAX_STR_VALUE]
+
+
+class RecipeSearchTerm(models.Model):
+    """
+    Запись обратного индекса для полнотекстового поиска рецептов.
+    """
+    term = models.CharField(
+        max_length=SEARCH_TERM_LENGHT,
+        verbose_name='Основа слова'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        related_name='search_terms',
+        on_delete=models.CASCADE
+    )
+    weight = models.PositiveIntegerField(verbose_name='Вес')
+
+    class Meta:
+        verbose_name = 'Поисковый термин'
+        verbose_name_plural = 'поисковые термины'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['term', 'recipe'],
+                name='unique_search_term'
+            )
+        ]
+
+    def __str__(self):
+        return self.term
@@ -0,0 +1,172 @@
+import csv
+import io
+import json
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.db import connection, transaction
+
+from recipes.models import Ingredient, Tag
+
+# Справочник: модель, загружаемые поля и поля уникального ключа.
+# Ключ должен совпадать с уникальным индексом таблицы: по нему
+# работает ON CONFLICT при загрузке через COPY.
+REFERENCE_MODELS = {
+    'ingredients': (Ingredient, ('name', 'measurement_unit'), ('name',)),
+    'tags': (Tag, ('name', 'slug'), ('slug',)),
+}
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file, fields: Tuple[str, ...]) -> Iterator[Dict[str, str]]:
+    """Построчно читает CSV без заголовка с колонками fields."""
+    for row in csv.reader(file):
+        if row:
+            yield dict(zip(fields, (value.strip() for value in row)))
+
+
+def read_json(file) -> Iterator[dict]:
+    """
+    Построчно читает JSON-массив объектов или JSON Lines.
+
+    Файл читается частями, поэтому в памяти не держится целиком.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,[]':
+            position += 1
+        if position == len(buffer):
+            if eof:
+                return
+            buffer = file.read(JSON_CHUNK_SIZE)
+            position = 0
+            eof = not buffer
+            continue
+        try:
+            obj, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = file.read(JSON_CHUNK_SIZE)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield obj
+        position = end
+
+
+def read_rows(path: str, fields: Tuple[str, ...],
+              file_format: Optional[str] = None) -> Iterator[Dict[str, str]]:
+    """Читает строки справочника из CSV, JSON или JSON Lines."""
+    if file_format is None:
+        file_format = 'csv' if path.lower().endswith('.csv') else 'json'
+    with open(path, encoding='utf8', newline='') as file:
+        rows = read_csv(file, fields) if file_format == 'csv' else (
+            read_json(file)
+        )
+        for row in rows:
+            yield {field: str(row[field]).strip() for field in fields}
+
+
+def batches(rows: Iterable, size: int) -> Iterator[List]:
+    rows = iter(rows)
+    batch = list(islice(rows, size))
+    while batch:
+        yield batch
+        batch = list(islice(rows, size))
+
+
+def upsert_batch(model, fields: Tuple[str, ...], unique: Tuple[str, ...],
+                 rows: List[Dict[str, str]]) -> Tuple[int, int]:
+    """
+    Добавляет новые строки и обновляет изменившиеся.
+
+    Существующие строки ищутся одним запросом по первому полю ключа.
+    Строки, добавленные параллельно другим процессом, пропускаются,
+    поэтому число добавленных строк считается по базе данных.
+    Возвращает число добавленных и обновленных строк.
+    """
+    rows = list({
+        tuple(row[field] for field in unique): row for row in rows
+    }.values())
+    other = [field for field in fields if field not in unique]
+    existing = {
+        tuple(getattr(obj, field) for field in unique): obj
+        for obj in model.objects.filter(**{
+            f'{unique[0]}__in': {row[unique[0]] for row in rows}
+        })
+    }
+    to_create = []
+    to_update = []
+    for row in rows:
+        obj = existing.get(tuple(row[field] for field in unique))
+        if obj is None:
+            to_create.append(model(**row))
+        elif any(getattr(obj, field) != row[field] for field in other):
+            for field in other:
+                setattr(obj, field, row[field])
+            to_update.append(obj)
+    created = 0
+    with transaction.atomic():
+        if to_create:
+            new = model.objects.filter(**{
+                f'{unique[0]}__in': {
+                    getattr(obj, unique[0]) for obj in to_create
+                }
+            })
+            before = new.count()
+            model.objects.bulk_create(to_create, ignore_conflicts=True)
+            created = new.count() - before
+        if to_update:
+            model.objects.bulk_update(to_update, other)
+    return created, len(to_update)
+
+
+def copy_batch(model, fields: Tuple[str, ...], unique: Tuple[str, ...],
+               rows: List[Dict[str, str]]) -> Tuple[int, int]:
+    """
+    Загружает строки через COPY во временную таблицу PostgreSQL.
+
+    Из временной таблицы строки переносятся одним INSERT ... ON CONFLICT.
+    Возвращает число добавленных и обновленных строк.
+    """
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(field) for field in fields)
+    keys = ', '.join(connection.ops.quote_name(field) for field in unique)
+    other = [
+        connection.ops.quote_name(field)
+        for field in fields if field not in unique
+    ]
+    if other:
+        conflict = 'DO UPDATE SET {} WHERE ({}) IS DISTINCT FROM ({})'.format(
+            ', '.join(f'{column} = EXCLUDED.{column}' for column in other),
+            ', '.join(f'{table}.{column}' for column in other),
+            ', '.join(f'EXCLUDED.{column}' for column in other),
+        )
+    else:
+        conflict = 'DO NOTHING'
+    data = io.StringIO()
+    writer = csv.writer(data)
+    for row in rows:
+        writer.writerow([row[field] for field in fields])
+    data.seek(0)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TEMP TABLE reference_import ON COMMIT DROP '
+            f'AS SELECT {columns} FROM {table} WITH NO DATA'
+        )
+        cursor.cursor.copy_expert(
+            f'COPY reference_import ({columns}) FROM STDIN WITH CSV', data
+        )
+        cursor.execute(
+            f'INSERT INTO {table} ({columns}) '
+            f'SELECT DISTINCT ON ({keys}) {columns} FROM reference_import '
+            f'ON CONFLICT ({keys}) {conflict} RETURNING (xmax = 0)'
+        )
+        results = [inserted for inserted, in cursor.fetchall()]
+    created = sum(results)
+    return created, len(results) - created
@@ -0,0 +1,52 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.counters import change_counter
+from recipes.models import Favorite, Recipe, ShopingList, Subscription
+from users.models import User
+
+
+@receiver(post_save, sender=Recipe)
+def increase_recipes_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, 'recipes_count', [instance.author_id], 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def decrease_recipes_count(sender, instance, **kwargs):
+    change_counter(User, 'recipes_count', [instance.author_id], -1)
+
+
+@receiver(post_save, sender=Subscription)
+def increase_subscribers_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, 'subscribers_count', [instance.author_id], 1)
+
+
+@receiver(post_delete, sender=Subscription)
+def decrease_subscribers_count(sender, instance, **kwargs):
+    change_counter(User, 'subscribers_count', [instance.author_id], -1)
+
+
+@receiver(post_save, sender=Favorite)
+def increase_favorites_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, 'favorites_count', [instance.recipe_id], 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def decrease_favorites_count(sender, instance, **kwargs):
+    change_counter(Recipe, 'favorites_count', [instance.recipe_id], -1)
+
+
+@receiver(post_save, sender=ShopingList)
+def increase_shopping_cart_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(
+            Recipe, 'shopping_cart_count', [instance.recipe_id], 1
+        )
+
+
+@receiver(post_delete, sender=ShopingList)
+def decrease_shopping_cart_count(sender, instance, **kwargs):
+    change_counter(Recipe, 'shopping_cart_count', [instance.recipe_id], -1)
@@ -0,0 +1,192 @@
+import os
+import shutil
+from typing import Any, Dict, Iterator, List, Optional
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Prefetch
+from django.utils.dateparse import parse_datetime
+
+from recipes.models import AmountIngredient, Ingredient, Recipe, Tag
+from users.models import User
+
+
+def recipe_record(recipe: Recipe) -> Dict[str, Any]:
+    """Рецепт со связями, где связанные объекты заданы натуральными ключами."""
+    return {
+        'author': recipe.author.username,
+        'name': recipe.name,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'pub_date': recipe.pub_date.isoformat(),
+        'image': recipe.image.name,
+        'tags': [tag.slug for tag in recipe.tags.all()],
+        'ingredients': [
+            {
+                'name': amount.ingredient.name,
+                'measurement_unit': amount.ingredient.measurement_unit,
+                'amount': amount.amount,
+            }
+            for amount in recipe.recipe_ingredients.all()
+        ],
+    }
+
+
+def export_records(batch_size: int) -> Iterator[Dict[str, Any]]:
+    """
+    Выгружает рецепты пачками по возрастанию id.
+
+    Каждая пачка загружается со связями за фиксированное число запросов,
+    поэтому память не растет с числом рецептов.
+    """
+    queryset = Recipe.objects.order_by('pk').select_related(
+        'author'
+    ).prefetch_related(
+        'tags',
+        Prefetch(
+            'recipe_ingredients',
+            AmountIngredient.objects.select_related('ingredient')
+        )
+    )
+    last_pk = 0
+    while True:
+        recipes = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+        if not recipes:
+            return
+        for recipe in recipes:
+            yield recipe_record(recipe)
+        last_pk = recipes[-1].pk
+
+
+def export_media(name: str, media_dir: str) -> None:
+    """Копирует файл из хранилища в media_dir, если его там еще нет."""
+    path = os.path.join(media_dir, name)
+    if not name or os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with default_storage.open(name) as source, open(path, 'wb') as target:
+        shutil.copyfileobj(source, target)
+
+
+def import_media(name: str, media_dir: str) -> str:
+    """
+    Копирует файл из media_dir в хранилище, если его там еще нет.
+
+    Возвращает имя файла в хранилище.
+    """
+    path = os.path.join(media_dir, name)
+    if default_storage.exists(name) or not os.path.exists(path):
+        return name
+    with open(path, 'rb') as source:
+        return default_storage.save(name, File(source))
+
+
+def import_batch(records: List[Dict[str, Any]],
+                 media_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Загружает пачку рецептов через bulk_create.
+
+    Авторы, теги и ингредиенты ищутся по натуральным ключам одним
+    запросом на модель. Рецепты, которые уже есть у автора, пропускаются;
+    рецепты с неизвестными связями не загружаются и попадают в errors.
+    Сигналы моделей при этом не отправляются.
+    """
+    authors = dict(User.objects.filter(
+        username__in={record.get('author') for record in records}
+    ).values_list('username', 'pk'))
+    tags = dict(Tag.objects.filter(
+        slug__in={slug for record in records for slug in record.get(
+            'tags', ())}
+    ).values_list('slug', 'pk'))
+    ingredients = {
+        (name, measurement_unit): pk
+        for name, measurement_unit, pk in Ingredient.objects.filter(
+            name__in={
+                item.get('name') for record in records
+                for item in record.get('ingredients', ())
+            }
+        ).values_list('name', 'measurement_unit', 'pk')
+    }
+    existing = set(Recipe.objects.filter(
+        author_id__in=authors.values(),
+        name__in={record.get('name') for record in records}
+    ).values_list('author_id', 'name'))
+    recipes = []
+    relations = []
+    errors = []
+    skipped = 0
+    for number, record in enumerate(records):
+        try:
+            author_id = authors.get(record['author'])
+            if author_id is None:
+                raise ValueError(f'автор {record["author"]} не найден')
+            key = (author_id, record['name'])
+            if key in existing:
+                skipped += 1
+                continue
+            tag_ids = [tags[slug] for slug in record['tags']]
+            amounts = [
+                (
+                    ingredients[(item['name'], item['measurement_unit'])],
+                    int(item['amount'])
+                )
+                for item in record['ingredients']
+            ]
+            pub_date = None
+            if record.get('pub_date'):
+                pub_date = parse_datetime(record['pub_date'])
+                if pub_date is None:
+                    raise ValueError(f'неверная дата {record["pub_date"]}')
+            image = record['image']
+            if media_dir:
+                image = import_media(image, media_dir)
+            recipe = Recipe(
+                author_id=author_id,
+                name=record['name'],
+                text=record['text'],
+                cooking_time=int(record['cooking_time']),
+                image=image,
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            errors.append(f'{record.get("name", number)}: {e!r}')
+            continue
+        existing.add(key)
+        recipes.append(recipe)
+        relations.append((pub_date, tag_ids, amounts))
+    with transaction.atomic():
+        Recipe.objects.bulk_create(recipes)
+        if not connection.features.can_return_rows_from_bulk_insert:
+            pks = {
+                (author_id, name): pk
+                for author_id, name, pk in Recipe.objects.filter(
+                    author_id__in={recipe.author_id for recipe in recipes},
+                    name__in={recipe.name for recipe in recipes}
+                ).values_list('author_id', 'name', 'pk')
+            }
+            for recipe in recipes:
+                recipe.pk = pks[(recipe.author_id, recipe.name)]
+        dated = []
+        for recipe, (pub_date, _, _) in zip(recipes, relations):
+            if pub_date is not None:
+                recipe.pub_date = pub_date
+                dated.append(recipe)
+        Recipe.objects.bulk_update(dated, ['pub_date'])
+        AmountIngredient.objects.bulk_create(
+            AmountIngredient(
+                recipe_id=recipe.pk, ingredient_id=ingredient_id,
+                amount=amount
+            )
+            for recipe, (_, _, amounts) in zip(recipes, relations)
+            for ingredient_id, amount in amounts
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag_id)
+            for recipe, (_, tag_ids, _) in zip(recipes, relations)
+            for tag_id in tag_ids
+        )
+    return {
+        'recipes': recipes,
+        'skipped': skipped,
+        'errors': errors,
+    }
@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
+from api.pagination import EstimatedCountPaginator
 from users.models import User
 
 
@@ -16,3 +17,5 @@ class UsersAdmin(UserAdmin):
         'role'
     )
     search_fields = ('username', 'email')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
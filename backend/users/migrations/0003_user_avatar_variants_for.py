@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='avatar_variants_for',
+            field=models.CharField(blank=True, editable=False, max_length=100, verbose_name='Аватар с готовыми вариантами'),
+        ),
+    ]
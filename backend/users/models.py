@@ -36,6 +36,22 @@ class User(AbstractUser):
         verbose_name='Аватар',
         default=None
     )
+    avatar_variants_for = models.CharField(
+        max_length=100,
+        blank=True,
+        editable=False,
+        verbose_name='Аватар с готовыми вариантами'
+    )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число рецептов'
+    )
+    subscribers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число подписчиков'
+    )
 
     class Meta:
         default_related_name = 'user'